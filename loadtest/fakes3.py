@@ -0,0 +1,505 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""A minimal, in-memory S3 stand-in for load testing.
+
+Only the parts of the S3 REST and HTTP POST APIs used by
+django-storages-s3upload are implemented, using path-style
+(``OrdinaryCallingFormat``) addressing. Signatures are not checked, but POST
+policy conditions are, so that policy regressions are caught.
+
+SHA-256 checksums (``x-amz-checksum-sha256``) are checked when uploading,
+and returned by HEAD/GET with ``x-amz-checksum-mode: ENABLED``.
+
+Multi-object delete (``POST ?delete``) is supported, for cleaning up after a
+failed archive expansion.
+
+Faults can be injected: a proportion of requests can fail with a
+``503 SlowDown`` error, or be delayed, to exercise retries and hedging.
+
+"""
+
+
+from __future__ import absolute_import, unicode_literals
+from base64 import b64decode, b64encode
+from collections import Counter
+from email.utils import formatdate
+from hashlib import md5, sha256
+from xml.etree import ElementTree
+import cgi
+import json
+import random
+import socket
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import quote, unquote, urlencode, urlsplit
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import quote, unquote, urlencode
+    from urlparse import urlsplit
+
+
+# Request headers which are stored with an object, and returned by HEAD/GET.
+STORED_HEADERS = ('cache-control', 'content-disposition', 'content-encoding',
+                  'content-type')
+
+# Checksum header, which is only returned with x-amz-checksum-mode: ENABLED.
+CHECKSUM_HEADER = 'x-amz-checksum-sha256'
+
+# POST form fields which are never subject to policy conditions.
+UNCONDITIONED_FIELDS = ('awsaccesskeyid', 'file', 'policy', 'signature')
+
+
+def get_checksum(data):
+    """Return the (base64 encoded) SHA-256 checksum of the data."""
+    return b64encode(sha256(data).digest()).decode('ascii')
+
+
+class FakeObject(object):
+
+    def __init__(self, data, headers):
+        self.data = data
+        self.headers = headers
+        self.etag = '"{0}"'.format(md5(data).hexdigest())
+        self.last_modified = time.time()
+
+
+class PolicyError(Exception):
+    pass
+
+
+class FakeS3Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, fake_s3):
+        self.fake_s3 = fake_s3
+        HTTPServer.__init__(self, server_address, handler_class)
+
+
+class FakeS3RequestHandler(BaseHTTPRequestHandler):
+
+    disable_nagle_algorithm = True
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def fake_s3(self):
+        return self.server.fake_s3
+
+    def _parse_path(self):
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        if isinstance(path, bytes):
+            # Python 2 unquotes to (utf-8 encoded) bytes.
+            path = path.decode('utf-8')
+        bucket, _, key = path.lstrip('/').partition('/')
+        return bucket, key, parts.query
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length and hasattr(socket, 'TCP_QUICKACK'):
+            # Acknowledge the request headers now: clients which send the
+            # body separately (e.g. boto) otherwise wait for a delayed ack.
+            self.connection.setsockopt(socket.IPPROTO_TCP,
+                                       socket.TCP_QUICKACK, 1)
+        return self.rfile.read(length) if length else b''
+
+    def _respond(self, status, body=b'', headers=None, send_body=True):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _error(self, status, code, send_body=True):
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<Error><Code>{0}</Code><Message>{0}</Message></Error>'
+                ).format(code)
+        self._respond(status, body, {'Content-Type': 'application/xml'},
+                      send_body=send_body)
+
+    def _object_headers(self, obj):
+        headers = dict(obj.headers)
+        if self.headers.get('x-amz-checksum-mode') != 'ENABLED':
+            headers.pop(CHECKSUM_HEADER, None)
+        headers.update({
+            'ETag': obj.etag,
+            'Last-Modified': formatdate(obj.last_modified, usegmt=True),
+        })
+        return headers
+
+    def _handle(self, operation, method):
+        self.fake_s3.record(operation)
+        self.fake_s3.delay()
+        fault = self.fake_s3.choose_fault(operation)
+        if fault == 'error':
+            self._read_body()
+            return self._error(503, 'SlowDown',
+                               send_body=self.command != 'HEAD')
+        elif fault == 'slow':
+            time.sleep(self.fake_s3.slow_delay)
+        method()
+
+    def do_DELETE(self):
+        self._handle('delete_object', self._delete_object)
+
+    def do_GET(self):
+        bucket, key, query = self._parse_path()
+        if not key:
+            self._handle('list_bucket', self._list_bucket)
+        else:
+            self._handle('get_object', self._get_object)
+
+    def do_HEAD(self):
+        bucket, key, query = self._parse_path()
+        if not key:
+            self._handle('head_bucket', lambda: self._respond(200))
+        else:
+            self._handle('head_object', self._head_object)
+
+    def do_POST(self):
+        bucket, key, query = self._parse_path()
+        if query == 'delete':
+            self._handle('delete_objects', self._delete_objects)
+        else:
+            self._handle('post_object', self._post_object)
+
+    def do_PUT(self):
+        bucket, key, query = self._parse_path()
+        if query == 'acl':
+            self._handle('put_acl', self._put_acl)
+        elif self.headers.get('x-amz-copy-source'):
+            self._handle('copy_object', self._copy_object)
+        else:
+            self._handle('put_object', self._put_object)
+
+    def _copy_object(self):
+        bucket, key, query = self._parse_path()
+        self._read_body()
+        source_bucket, _, source_key = unquote(
+            self.headers['x-amz-copy-source']).lstrip('/').partition('/')
+        source = self.fake_s3.get(source_bucket, source_key)
+        if source is None:
+            return self._error(404, 'NoSuchKey')
+        if_match = self.headers.get('x-amz-copy-source-if-match')
+        if if_match and if_match != source.etag:
+            return self._error(412, 'PreconditionFailed')
+        if self.headers.get('x-amz-metadata-directive') == 'REPLACE':
+            headers = self._request_object_headers()
+        else:
+            headers = dict(source.headers)
+            if self.headers.get('x-amz-acl'):
+                headers['x-amz-acl'] = self.headers['x-amz-acl']
+        # The checksum is only kept if requested for the copy
+        headers.pop(CHECKSUM_HEADER, None)
+        if self.headers.get('x-amz-checksum-algorithm') == 'SHA256':
+            headers[CHECKSUM_HEADER] = get_checksum(source.data)
+        obj = self.fake_s3.put(bucket, key, source.data, headers)
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<CopyObjectResult><LastModified>{0}</LastModified>'
+                '<ETag>{1}</ETag></CopyObjectResult>').format(
+                    time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+                    obj.etag.replace('"', '&quot;'))
+        self._respond(200, body, {'Content-Type': 'application/xml'})
+
+    def _delete_object(self):
+        bucket, key, query = self._parse_path()
+        self._read_body()
+        self.fake_s3.delete(bucket, key)
+        self._respond(204)
+
+    def _delete_objects(self):
+        bucket, key, query = self._parse_path()
+        document = ElementTree.fromstring(self._read_body())
+        for element in document.iter('Key'):
+            self.fake_s3.delete(bucket, element.text)
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<DeleteResult></DeleteResult>')
+        self._respond(200, body, {'Content-Type': 'application/xml'})
+
+    def _get_object(self):
+        bucket, key, query = self._parse_path()
+        obj = self.fake_s3.get(bucket, key)
+        if obj is None:
+            return self._error(404, 'NoSuchKey')
+        headers = self._object_headers(obj)
+        data = obj.data
+        status = 200
+        byte_range = self.headers.get('Range', '')
+        if byte_range.startswith('bytes='):
+            start, _, end = byte_range[len('bytes='):].partition('-')
+            start = int(start)
+            end = min(int(end) if end else len(data) - 1, len(data) - 1)
+            headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                start, end, len(data))
+            data = data[start:end + 1]
+            status = 206
+        self._respond(status, data, headers)
+
+    def _head_object(self):
+        bucket, key, query = self._parse_path()
+        obj = self.fake_s3.get(bucket, key)
+        if obj is None:
+            return self._error(404, 'NoSuchKey', send_body=False)
+        self.send_response(200)
+        for name, value in self._object_headers(obj).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(obj.data)))
+        self.end_headers()
+
+    def _list_bucket(self):
+        bucket, key, query = self._parse_path()
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<ListBucketResult><Name>{0}</Name><Prefix></Prefix>'
+                '<Marker></Marker><MaxKeys>0</MaxKeys>'
+                '<IsTruncated>false</IsTruncated></ListBucketResult>'
+                ).format(bucket)
+        self._respond(200, body, {'Content-Type': 'application/xml'})
+
+    def _post_object(self):
+        bucket, key, query = self._parse_path()
+        form = cgi.FieldStorage(
+            fp=self.rfile, headers=self.headers,
+            environ={'REQUEST_METHOD': 'POST',
+                     'CONTENT_TYPE': self.headers['Content-Type']})
+        fields = {}
+        for name in form.keys():
+            if name.lower() != 'file':
+                fields[name.lower()] = form.getfirst(name)
+        upload = form['file']
+        data = upload.value
+        fields['key'] = fields.get('key', '').replace(
+            '${filename}', upload.filename or '')
+        fields['bucket'] = bucket
+
+        try:
+            self.fake_s3.check_policy(fields, len(data))
+        except PolicyError as error:
+            return self._error(error.args[0], error.args[1])
+
+        headers = dict((name, fields[name]) for name in STORED_HEADERS
+                       if fields.get(name))
+        headers.update((name, value) for name, value in fields.items()
+                       if name.startswith('x-amz-meta-'))
+        if fields.get('acl'):
+            headers['x-amz-acl'] = fields['acl']
+        if fields.get(CHECKSUM_HEADER):
+            headers[CHECKSUM_HEADER] = fields[CHECKSUM_HEADER]
+        if not self._check_checksum(headers, data):
+            return self._error(400, 'BadDigest')
+        obj = self.fake_s3.put(bucket, fields['key'], data, headers)
+
+        result = {'bucket': bucket, 'key': fields['key'], 'etag': obj.etag}
+        redirect = fields.get('success_action_redirect')
+        if redirect:
+            separator = '&' if '?' in redirect else '?'
+            location = redirect + separator + urlencode(result)
+            return self._respond(303, headers={'Location': location})
+
+        status = int(fields.get('success_action_status') or 204)
+        if status == 201:
+            body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                    '<PostResponse><Location>{0}</Location>'
+                    '<Bucket>{1}</Bucket><Key>{2}</Key><ETag>{3}</ETag>'
+                    '</PostResponse>').format(
+                        self.fake_s3.url + quote(bucket + '/' + result['key']),
+                        bucket, result['key'],
+                        obj.etag.replace('"', '&quot;'))
+            return self._respond(201, body,
+                                 {'Content-Type': 'application/xml',
+                                  'ETag': obj.etag})
+        self._respond(status if status in (200, 204) else 204,
+                      headers={'ETag': obj.etag})
+
+    def _put_acl(self):
+        bucket, key, query = self._parse_path()
+        self._read_body()
+        obj = self.fake_s3.get(bucket, key)
+        if obj is None:
+            return self._error(404, 'NoSuchKey')
+        if self.headers.get('x-amz-acl'):
+            obj.headers['x-amz-acl'] = self.headers['x-amz-acl']
+        self._respond(200)
+
+    def _put_object(self):
+        bucket, key, query = self._parse_path()
+        data = self._read_body()
+        headers = self._request_object_headers()
+        if self.headers.get(CHECKSUM_HEADER):
+            headers[CHECKSUM_HEADER] = self.headers[CHECKSUM_HEADER]
+        if not self._check_checksum(headers, data):
+            return self._error(400, 'BadDigest')
+        obj = self.fake_s3.put(bucket, key, data, headers)
+        self._respond(200, headers={'ETag': obj.etag})
+
+    def _check_checksum(self, headers, data):
+        checksum = headers.get(CHECKSUM_HEADER)
+        return not checksum or checksum == get_checksum(data)
+
+    def _request_object_headers(self):
+        headers = {}
+        for name, value in self.headers.items():
+            name = name.lower()
+            if name in STORED_HEADERS or name.startswith('x-amz-meta-') or \
+                    name == 'x-amz-acl':
+                headers[name] = value
+        return headers
+
+
+class FakeS3(object):
+    """In-memory S3 stand-in, served over HTTP from a background thread.
+
+    :param latency: Seconds to wait before responding to each request.
+    :param error_rate: Proportion of requests to fail with a 503 error.
+    :param slow_rate: Proportion of requests to delay by ``slow_delay``.
+    :param slow_delay: Seconds to delay slow requests by.
+    :param fault_operations: Operations which faults are injected into. By
+        default, all operations except the POST upload (made by the client).
+
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, error_rate=0,
+                 slow_rate=0, slow_delay=1, fault_operations=None, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.fault_operations = fault_operations
+        self.counts = Counter()
+        self.faults = Counter()
+        self._random = random.Random(seed)
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._server = FakeS3Server((host, port), FakeS3RequestHandler, self)
+        self.host, self.port = self._server.server_address[:2]
+        self.url = 'http://{0}:{1}/'.format(self.host, self.port)
+
+    def start(self):
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def check_policy(self, fields, content_length):
+        """Check POST form fields against the (base64 encoded) policy."""
+        try:
+            policy = json.loads(b64decode(fields['policy']).decode('utf-8'))
+        except (KeyError, TypeError, ValueError):
+            raise PolicyError(400, 'InvalidPolicyDocument')
+
+        conditioned = set(['bucket'])
+        for condition in policy.get('conditions', []):
+            if isinstance(condition, dict):
+                (name, value), = condition.items()
+                operator = 'eq'
+            elif condition[0] == 'content-length-range':
+                # Not a field, so the bounds are integers rather than names
+                if not condition[1] <= content_length <= condition[2]:
+                    code = 'EntityTooLarge' if content_length > condition[2] \
+                        else 'EntityTooSmall'
+                    raise PolicyError(400, code)
+                continue
+            else:
+                operator, name, value = condition
+            name = name.lstrip('$').lower()
+
+            conditioned.add(name)
+            actual = fields.get(name)
+            if actual is None or \
+                    (operator == 'eq' and actual != value) or \
+                    (operator == 'starts-with' and
+                     not actual.startswith(value)):
+                raise PolicyError(403, 'AccessDenied')
+
+        for name in fields:
+            if name not in conditioned and name not in UNCONDITIONED_FIELDS \
+                    and not name.startswith('x-ignore-'):
+                raise PolicyError(403, 'AccessDenied')
+
+    def choose_fault(self, operation):
+        """Return the fault to inject into a request ('error', 'slow'), if
+        any."""
+        if self.fault_operations is None:
+            if operation == 'post_object':
+                return None
+        elif operation not in self.fault_operations:
+            return None
+        with self._lock:
+            value = self._random.random()
+            fault = None
+            if value < self.error_rate:
+                fault = 'error'
+            elif value < self.error_rate + self.slow_rate:
+                fault = 'slow'
+            if fault:
+                self.faults[fault] += 1
+        return fault
+
+    def seed(self, seed):
+        """Seed the choice of faults to inject, for repeatable runs."""
+        with self._lock:
+            self._random.seed(seed)
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def delete(self, bucket, key):
+        with self._lock:
+            self._objects.pop((bucket, key), None)
+
+    def get(self, bucket, key):
+        with self._lock:
+            return self._objects.get((bucket, key))
+
+    def put(self, bucket, key, data, headers):
+        obj = FakeObject(data, headers)
+        with self._lock:
+            self._objects[(bucket, key)] = obj
+        return obj
+
+    def record(self, operation):
+        with self._lock:
+            self.counts[operation] += 1
+
+    def reset(self):
+        """Remove all objects, and reset the counts."""
+        with self._lock:
+            self._objects.clear()
+        self.reset_counts()
+
+    def reset_counts(self):
+        with self._lock:
+            self.counts.clear()
+            self.faults.clear()
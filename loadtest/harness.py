@@ -0,0 +1,502 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Concurrent load harness simulating browser (and Dropzone) upload clients.
+
+Each simulated client runs the full upload flow against the views, using the
+Django test client, and a local :py:class:`loadtest.fakes3.FakeS3` endpoint:
+
+* ``redirect`` flow (``S3UploadFormView``): GET the form, POST the file to
+  the form action, then GET the ``success_action_redirect`` URL (including the
+  CSRF check).
+
+* ``token`` flow: as the ``redirect`` flow, but authenticating the redirect
+  with a signed token rather than the csrf token.
+
+* ``dropzone`` flow (``DropzoneS3UploadFormView``): GET the form, POST the
+  file to the form action, then POST the S3 response to the view as the
+  ``pingServer`` callback does. The file is gzip compressed first, and its
+  SHA-256 checksum sent, as ``dropzone-options.js`` does, if the form permits
+  compression and requires checksums.
+
+* ``put`` flow (presigned PUT): GET the form once (for the csrf token), then
+  for each file POST a JSON signing request (with the file's checksum) to the
+  view, PUT the file to the presigned URL, then POST the bucket, key and etag
+  to the view.
+
+* ``archive`` flow: as the ``redirect`` flow, but uploading a zip archive of
+  ``--archive-members`` text files (and one binary file, which is skipped),
+  which the view expands into a processed file for each member.
+
+Throughput, latency percentiles and error rates are reported for each phase.
+
+"""
+
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+from .fakes3 import FakeS3, get_checksum
+from collections import Counter, OrderedDict
+from xml.etree import ElementTree
+import argparse
+import gzip
+import io
+import json
+import os
+import threading
+import time
+import uuid
+import zipfile
+
+try:
+    from html.parser import HTMLParser
+    from http.client import HTTPConnection
+    from urllib.parse import urlsplit
+except ImportError:
+    from HTMLParser import HTMLParser
+    from httplib import HTTPConnection
+    from urlparse import urlsplit
+
+
+BUCKET_NAME = 'loadtest'
+
+FLOWS = OrderedDict([
+    ('redirect', ('/upload/', ('form', 'upload', 'redirect'))),
+    ('token', ('/upload-token/', ('form', 'upload', 'redirect'))),
+    ('dropzone', ('/dropzone/', ('form', 'upload', 'ping'))),
+    ('put', ('/put/', ('form', 'sign', 'upload', 'ping'))),
+    ('archive', ('/archive/', ('form', 'upload', 'redirect'))),
+])
+
+# S3 operations which are made by the client (or for each archive member),
+# rather than for each upload by the views.
+UNCOUNTED_OPERATIONS = {
+    'put': ('put_object',),
+    'archive': ('post_object', 'put_object'),
+}
+
+
+def configure(fake_s3, **overrides):
+    """Configure Django to use the fake S3 endpoint as the default storage."""
+    import django
+    from boto.s3.connection import OrdinaryCallingFormat
+    from django.conf import settings
+
+    options = {
+        'ALLOWED_HOSTS': ['*'],
+        'AWS_ACCESS_KEY_ID': 'loadtest',
+        'AWS_DEFAULT_ACL': 'private',
+        'AWS_QUERYSTRING_AUTH': False,
+        'AWS_S3_CALLING_FORMAT': OrdinaryCallingFormat(),
+        'AWS_S3_HOST': fake_s3.host,
+        'AWS_S3_PORT': fake_s3.port,
+        # boto forces port 80 when generating http urls if this is False.
+        'AWS_S3_SECURE_URLS': True,
+        'AWS_S3_USE_SSL': False,
+        'AWS_SECRET_ACCESS_KEY': 'loadtest',
+        'AWS_STORAGE_BUCKET_NAME': BUCKET_NAME,
+        'DATABASES': {},
+        'DEFAULT_FILE_STORAGE': 'storages.backends.s3boto.S3BotoStorage',
+        'INSTALLED_APPS': ['django.contrib.staticfiles', 's3upload'],
+        'MIDDLEWARE_CLASSES': ['django.middleware.csrf.CsrfViewMiddleware'],
+        'ROOT_URLCONF': 'loadtest.urls',
+        'SECRET_KEY': 'loadtest',
+        'STATIC_URL': '/static/',
+        'TEMPLATES': [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'APP_DIRS': True,
+        }],
+    }
+    options.update(overrides)
+    settings.configure(**options)
+    django.setup()
+
+
+def configure_boto(**options):
+    """Set boto config options (e.g. ``num_retries``)."""
+    import boto
+    if not boto.config.has_section('Boto'):
+        boto.config.add_section('Boto')
+    for name, value in options.items():
+        boto.config.set('Boto', name, str(value))
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0
+    index = max(0, int(round(percent / 100 * len(values) + 0.5)) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+class FlowError(Exception):
+    pass
+
+
+class FormParser(HTMLParser):
+    """Extract the action, data attributes and inputs of an upload form."""
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.action = None
+        self.attributes = {}
+        self.fields = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form' and self.action is None:
+            self.action = attrs.get('action')
+            self.attributes = attrs
+        elif tag == 'input' and attrs.get('type') == 'hidden':
+            self.fields.append((attrs['name'], attrs.get('value') or ''))
+
+    handle_startendtag = handle_starttag
+
+
+class Stats(object):
+
+    def __init__(self, phases):
+        self.errors = OrderedDict((phase, Counter()) for phase in phases)
+        self.latencies = OrderedDict((phase, []) for phase in phases)
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    def record(self, phase, seconds, error=None):
+        with self._lock:
+            if error:
+                self.errors[phase][error] += 1
+            else:
+                self.latencies[phase].append(seconds)
+
+    def record_completed(self):
+        with self._lock:
+            self.completed += 1
+
+
+class SimulatedClient(object):
+    """A browser running the upload flow repeatedly, with its own cookies."""
+
+    def __init__(self, flow, stats, file_size=4096, archive_members=10):
+        from django.test import Client
+        self.flow = flow
+        self.path = FLOWS[flow][0]
+        self.stats = stats
+        self.file_size = file_size
+        self.archive_members = archive_members
+        self.client = Client(enforce_csrf_checks=True)
+        self.id = uuid.uuid4().hex
+        self.csrf_token = None
+        self._connections = {}
+
+    def _encode_multipart(self, fields, filename, content):
+        boundary = uuid.uuid4().hex
+        lines = []
+        for name, value in fields:
+            lines += ['--' + boundary,
+                      'Content-Disposition: form-data; name="{0}"'.format(
+                          name),
+                      '', value]
+        lines += ['--' + boundary,
+                  'Content-Disposition: form-data; name="file"; '
+                  'filename="{0}"'.format(filename),
+                  'Content-Type: application/octet-stream', '', '']
+        body = '\r\n'.join(lines).encode('utf-8') + content + \
+            '\r\n--{0}--\r\n'.format(boundary).encode('utf-8')
+        return body, 'multipart/form-data; boundary={0}'.format(boundary)
+
+    def _get_connection(self, netloc):
+        if netloc not in self._connections:
+            self._connections[netloc] = HTTPConnection(netloc)
+        return self._connections[netloc]
+
+    def _timed(self, phase, function, *args):
+        start = time.time()
+        try:
+            result = function(*args)
+        except FlowError as error:
+            self.stats.record(phase, time.time() - start, str(error))
+            raise
+        except Exception as error:
+            self.stats.record(phase, time.time() - start,
+                              type(error).__name__)
+            raise FlowError(type(error).__name__)
+        self.stats.record(phase, time.time() - start)
+        return result
+
+    def get_form(self):
+        response = self.client.get(self.path)
+        if response.status_code != 200:
+            raise FlowError('HTTP {0}'.format(response.status_code))
+        parser = FormParser()
+        parser.feed(response.content.decode('utf-8'))
+        return parser
+
+    def prepare_upload(self, form, content):
+        """Return form fields and content, gzip compressed if permitted, and
+        with a checksum if required."""
+        fields = list(form.fields)
+        if form.attributes.get('data-compress-content-types'):
+            buffer = io.BytesIO()
+            with gzip.GzipFile(fileobj=buffer, mode='wb') as gzip_file:
+                gzip_file.write(content)
+            content = buffer.getvalue()
+            fields.append(('Content-Encoding', 'gzip'))
+        if form.attributes.get('data-checksum'):
+            fields += [('x-amz-checksum-algorithm', 'SHA256'),
+                       ('x-amz-checksum-sha256', get_checksum(content))]
+        return fields, content
+
+    def post_upload(self, form, filename, content):
+        action = urlsplit(form.action)
+        fields, content = self.prepare_upload(form, content)
+        body, content_type = self._encode_multipart(fields, filename, content)
+        connection = self._get_connection(action.netloc)
+        try:
+            # Native strings, as httplib (on Python 2) otherwise decodes the
+            # (binary) body when joining it to the request headers.
+            connection.request(str('POST'), str(action.path or '/'), body,
+                               {str('Content-Type'): str(content_type)})
+            response = connection.getresponse()
+            response_body = response.read()
+        except Exception:
+            self._connections.pop(action.netloc).close()
+            raise
+        if response.status >= 400:
+            raise FlowError('S3 HTTP {0}'.format(response.status))
+        return response, response_body
+
+    def get_redirect(self, location):
+        parts = urlsplit(location)
+        response = self.client.get('{0}?{1}'.format(parts.path, parts.query))
+        if response.status_code != 302:
+            raise FlowError('HTTP {0}'.format(response.status_code))
+
+    def post_ping(self, form, response_body):
+        document = ElementTree.fromstring(response_body)
+        data = dict((name.lower(), document.find(name).text)
+                    for name in ('Bucket', 'Key', 'ETag'))
+        response = self.client.post(
+            self.path, data, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            HTTP_X_CSRFTOKEN=form.attributes.get('data-csrf-token', ''))
+        if response.status_code != 200:
+            raise FlowError('HTTP {0}'.format(response.status_code))
+
+    def post_sign(self, filename, content):
+        data = {'files': [{'content_type': 'text/plain', 'size': len(content),
+                           'filename': filename,
+                           'checksum_sha256': get_checksum(content)}]}
+        response = self.client.post(
+            self.path, json.dumps(data), content_type='application/json',
+            HTTP_X_CSRFTOKEN=self.csrf_token)
+        if response.status_code != 200:
+            raise FlowError('HTTP {0}'.format(response.status_code))
+        return json.loads(response.content.decode('utf-8'))['uploads'][0]
+
+    def put_upload(self, upload, content):
+        url = urlsplit(upload['url'])
+        headers = dict((str(name), str(value))
+                       for name, value in upload['headers'].items())
+        connection = self._get_connection(url.netloc)
+        try:
+            connection.request(str('PUT'), str(url.path + '?' + url.query),
+                               content, headers)
+            response = connection.getresponse()
+            response.read()
+        except Exception:
+            self._connections.pop(url.netloc).close()
+            raise
+        if response.status >= 400:
+            raise FlowError('S3 HTTP {0}'.format(response.status))
+        return response.getheader('ETag')
+
+    def post_put_ping(self, upload, etag):
+        data = {'bucket': upload['bucket'], 'key': upload['key'],
+                'etag': etag}
+        response = self.client.post(
+            self.path, data, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            HTTP_X_CSRFTOKEN=self.csrf_token)
+        if response.status_code != 200:
+            raise FlowError('HTTP {0}'.format(response.status_code))
+
+    def upload_put(self, index):
+        filename = '{0}-{1}.txt'.format(self.id, index)
+        content = b'x' * self.file_size
+        if self.csrf_token is None:
+            form = self._timed('form', self.get_form)
+            self.csrf_token = form.attributes.get('data-csrf-token', '')
+        upload = self._timed('sign', self.post_sign, filename, content)
+        etag = self._timed('upload', self.put_upload, upload, content)
+        self._timed('ping', self.post_put_ping, upload, etag)
+        self.stats.record_completed()
+
+    def make_archive(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for index in range(self.archive_members):
+                archive.writestr('files/{0}.txt'.format(index),
+                                 b'x' * self.file_size)
+            archive.writestr('skipped.bin', os.urandom(self.file_size))
+        return buffer.getvalue()
+
+    def upload(self, index):
+        if self.flow == 'put':
+            return self.upload_put(index)
+        if self.flow == 'archive':
+            filename = '{0}-{1}.zip'.format(self.id, index)
+            content = self.make_archive()
+        else:
+            filename = '{0}-{1}.txt'.format(self.id, index)
+            content = b'x' * self.file_size
+        form = self._timed('form', self.get_form)
+        response, response_body = self._timed(
+            'upload', self.post_upload, form, filename, content)
+        if self.flow in ('redirect', 'token', 'archive'):
+            self._timed('redirect', self.get_redirect,
+                        response.getheader('Location'))
+        else:
+            self._timed('ping', self.post_ping, form, response_body)
+        self.stats.record_completed()
+
+    def run(self, uploads):
+        for index in range(uploads):
+            try:
+                self.upload(index)
+            except FlowError:
+                pass
+        for connection in self._connections.values():
+            connection.close()
+
+
+def run(flow, clients, uploads, file_size=4096, archive_members=10):
+    """Run simulated clients concurrently, returning stats and duration."""
+    stats = Stats(FLOWS[flow][1])
+    simulated_clients = [SimulatedClient(flow, stats, file_size,
+                                         archive_members)
+                         for index in range(clients)]
+    threads = [threading.Thread(target=client.run, args=(uploads,))
+               for client in simulated_clients]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.time() - start
+
+
+def report(flow, stats, duration, s3_counts, s3_faults, resilience_counts):
+    print('Flow: {0}, completed uploads: {1} in {2:.2f}s '
+          '({3:.1f} uploads/s)'.format(flow, stats.completed, duration,
+                                       stats.completed / duration))
+    print('{0:<10} {1:>8} {2:>8} {3:>9} {4:>9} {5:>9} {6:>9} {7:>9}'.format(
+        'phase', 'count', 'errors', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms',
+        'max ms'))
+    for phase, latencies in stats.latencies.items():
+        latencies = sorted(latencies)
+        errors = sum(stats.errors[phase].values())
+        print('{0:<10} {1:>8} {2:>8} {3:>9.1f} {4:>9.1f} {5:>9.1f} {6:>9.1f} '
+              '{7:>9.1f}'.format(
+                  phase, len(latencies) + errors, errors,
+                  len(latencies) / duration,
+                  percentile(latencies, 50) * 1000,
+                  percentile(latencies, 90) * 1000,
+                  percentile(latencies, 99) * 1000,
+                  (latencies[-1] if latencies else 0) * 1000))
+        for error, count in stats.errors[phase].most_common():
+            print('{0:<10} {1:>8} {2}'.format('', count, error))
+    print('S3 requests per completed upload:')
+    for operation, count in sorted(s3_counts.items()):
+        print('  {0:<16} {1:.2f}'.format(
+            operation, count / max(stats.completed, 1)))
+    if s3_faults:
+        print('S3 faults injected: {0}'.format(', '.join(
+            '{0}={1}'.format(*item) for item in sorted(s3_faults.items()))))
+    if resilience_counts:
+        print('Resilience counters: {0}'.format(', '.join(
+            '{0}={1}'.format(*item)
+            for item in sorted(resilience_counts.items()))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--flow', choices=list(FLOWS) + ['all'],
+                        default='all')
+    parser.add_argument('--clients', type=int, default=10,
+                        help='Number of concurrent simulated clients.')
+    parser.add_argument('--uploads', type=int, default=10,
+                        help='Number of uploads per client.')
+    parser.add_argument('--file-size', type=int, default=4096,
+                        help='Size of each uploaded file in bytes.')
+    parser.add_argument('--archive-members', type=int, default=10,
+                        help='Number of files in each archive (archive '
+                             'flow).')
+    parser.add_argument('--s3-latency', type=float, default=0,
+                        help='Latency (ms) added to each fake S3 request.')
+    parser.add_argument('--s3-error-rate', type=float, default=0,
+                        help='Proportion of fake S3 requests to fail.')
+    parser.add_argument('--s3-slow-rate', type=float, default=0,
+                        help='Proportion of fake S3 requests to delay.')
+    parser.add_argument('--s3-slow-delay', type=float, default=1000,
+                        help='Delay (ms) of slow fake S3 requests.')
+    parser.add_argument('--retry-attempts', type=int, default=None,
+                        help='S3UPLOAD_RETRY_ATTEMPTS setting (by default, '
+                             'the setting\'s default).')
+    parser.add_argument('--hedge-delay', type=float, default=None,
+                        help='S3UPLOAD_HEDGE_DELAY setting (ms).')
+    parser.add_argument('--boto-retries', type=int, default=None,
+                        help='boto num_retries config option (by default, '
+                             'boto\'s default).')
+    parser.add_argument('--max-s3-requests', type=float, default=None,
+                        help='Fail if the number of S3 requests made by the '
+                             'views per completed upload exceeds this.')
+    args = parser.parse_args(argv)
+
+    fake_s3 = FakeS3(latency=args.s3_latency / 1000,
+                     error_rate=args.s3_error_rate,
+                     slow_rate=args.s3_slow_rate,
+                     slow_delay=args.s3_slow_delay / 1000).start()
+    overrides = {'S3UPLOAD_HEDGE_DELAY': (args.hedge_delay / 1000
+                                          if args.hedge_delay else None)}
+    if args.retry_attempts is not None:
+        overrides.update({'S3UPLOAD_RETRY_ATTEMPTS': args.retry_attempts})
+    configure(fake_s3, **overrides)
+    if args.boto_retries is not None:
+        configure_boto(num_retries=args.boto_retries)
+    from s3upload.resilience import counters
+    failed = False
+    try:
+        flows = list(FLOWS) if args.flow == 'all' else [args.flow]
+        for flow in flows:
+            fake_s3.reset_counts()
+            counters.reset()
+            stats, duration = run(flow, args.clients, args.uploads,
+                                  args.file_size, args.archive_members)
+            report(flow, stats, duration, fake_s3.counts, fake_s3.faults,
+                   counters.snapshot())
+            uncounted = UNCOUNTED_OPERATIONS.get(flow, ('post_object',))
+            requests = sum(count for operation, count in fake_s3.counts.items()
+                           if operation not in uncounted)
+            requests_per_upload = requests / max(stats.completed, 1)
+            if args.max_s3_requests is not None and \
+                    requests_per_upload > args.max_s3_requests:
+                print('S3 requests per upload ({0:.2f}) exceeds the maximum '
+                      'of {1}.'.format(requests_per_upload,
+                                       args.max_s3_requests))
+                failed = True
+            print()
+    finally:
+        fake_s3.stop()
+    return 1 if failed else 0
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Startup (import time) regression check for the s3upload package.
+
+Importing ``s3upload.views`` is timed in a fresh interpreter, after importing
+the Django modules it depends upon, so that only the cost of s3upload itself
+is measured. The check fails if the import takes longer than the given
+threshold, or if it loads any dependencies which should be deferred until
+first use (e.g. libmagic, boto, or multiprocessing).
+
+Run with ``python -m loadtest.importtime --help``.
+
+"""
+
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+import argparse
+import json
+import subprocess
+import sys
+
+
+DEFERRED_MODULES = ['boto', 'magic', 'multiprocessing', 'storages']
+
+SCRIPT = '''
+import json, sys, time
+from django.conf import settings
+settings.configure()
+import django.forms, django.http, django.views.generic
+import django.views.decorators.csrf, django.core.files.storage
+before = set(sys.modules)
+start = time.time()
+import s3upload.views
+duration = time.time() - start
+print(json.dumps({'duration': duration,
+                  'modules': sorted(set(sys.modules) - before)}))
+'''
+
+
+def measure():
+    """Return the import duration (seconds) and newly imported modules."""
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT])
+    result = json.loads(output.decode('utf-8'))
+    return result['duration'], result['modules']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--max-ms', type=float, default=20,
+                        help='Maximum permitted import time (ms).')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of measurements (the best is used).')
+    args = parser.parse_args(argv)
+
+    measurements = [measure() for index in range(args.repeat)]
+    duration, modules = min(measurements)
+    deferred = sorted(set(name for name in modules
+                          if name.split('.')[0] in DEFERRED_MODULES))
+
+    print('Imported s3upload.views in {0:.1f}ms (best of {1}), loading {2} '
+          'new modules.'.format(duration * 1000, args.repeat, len(modules)))
+    failed = False
+    if deferred:
+        print('Modules which should be deferred until first use were '
+              'imported: {0}'.format(', '.join(deferred)))
+        failed = True
+    if duration * 1000 > args.max_ms:
+        print('Import time exceeds the maximum of {0:.1f}ms.'.format(
+            args.max_ms))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""URLs for the views under load test."""
+
+
+from __future__ import absolute_import, unicode_literals
+from datetime import timedelta
+from django.conf.urls import url
+from django.http import HttpResponse
+from s3upload.views import DropzoneS3UploadFormView, S3UploadFormView
+
+
+def done(request):
+    return HttpResponse('Done.')
+
+
+urlpatterns = [
+    url(r'^upload/$', S3UploadFormView.as_view(success_url='/done/'),
+        name='upload'),
+    url(r'^upload-token/$', S3UploadFormView.as_view(
+        success_url='/done/', redirect_authentication='token',
+        expiration_resolution=timedelta(minutes=5)), name='upload-token'),
+    url(r'^dropzone/$', DropzoneS3UploadFormView.as_view(
+        compress_content_types=['text/'], require_checksum=True),
+        name='dropzone'),
+    url(r'^put/$', DropzoneS3UploadFormView.as_view(
+        presigned_put=True, require_checksum=True), name='put'),
+    url(r'^archive/$', S3UploadFormView.as_view(
+        success_url='/done/', expand_archives=True,
+        content_type_prefix='text/'), name='archive'),
+    url(r'^done/$', done, name='done'),
+]
@@ -24,3 +24,6 @@ __url__ = 'https://github.com/mattaustin/django-storages-s3upload'
 __author__ = 'Matt Austin <mail@mattaustin.me.uk>'
 __copyright__ = 'Copyright 2014 Matt Austin'
 __license__ = 'Apache 2.0'
+
+
+default_app_config = 's3upload.apps.S3UploadConfig'
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from .settings import settings
+from django.apps import AppConfig
+
+
+class S3UploadConfig(AppConfig):
+
+    name = 's3upload'
+
+    verbose_name = 'S3 upload'
+
+    def ready(self):
+        # Fork the derivative render pool before the server starts any
+        # request threads (see s3upload.derivatives).
+        if settings.DERIVATIVE_PROCESSES:
+            from .derivatives import start_render_pool
+            start_render_pool()
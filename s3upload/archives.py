@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Expansion of archive (zip and tar) uploads into many processed files.
+
+The archive is streamed from the bucket: tar archives (optionally gzip or
+bzip2 compressed) are read member by member, and zip archives, which must be
+read from the end, are first spooled to memory or, if larger than
+``S3UPLOAD_ARCHIVE_SPOOL_SIZE``, a temporary file. The content type of each
+member is sniffed, and members which do not start with the content type
+prefix are skipped, as are members with the same name as an earlier member.
+The remaining members are uploaded concurrently from a shared thread pool of
+``S3UPLOAD_ARCHIVE_PUT_CONCURRENCY`` threads, with at most that many members
+(of all archives being expanded by the process) held in memory at once.
+
+Archives are limited to ``S3UPLOAD_ARCHIVE_MAX_MEMBERS`` files, each no larger
+than ``S3UPLOAD_ARCHIVE_MAX_MEMBER_SIZE``, and ``S3UPLOAD_ARCHIVE_MAX_SIZE``
+in total (uncompressed). If a limit is exceeded, or a member cannot be
+uploaded, the members already uploaded are deleted and :py:class:`ArchiveError`
+is raised.
+
+"""
+
+
+from __future__ import absolute_import, unicode_literals
+from . import resilience
+from .derivatives import delete_keys
+from .forms import get_magic
+from .settings import settings
+from django.utils import six
+from django.utils.encoding import force_text
+import posixpath
+import sys
+import threading
+
+
+ARCHIVE_CONTENT_TYPES = ('application/gzip', 'application/x-bzip2',
+                         'application/x-gzip', 'application/x-tar',
+                         'application/zip')
+"""Content types of the archives which can be expanded."""
+
+CHUNK_SIZE = 64 * 1024
+
+_lock = threading.Lock()
+
+_put_pool = None
+
+_put_slots = None
+
+
+class ArchiveError(ValueError):
+    """The archive cannot be expanded, or exceeds a limit."""
+
+
+def clean_member_name(name):
+    """Return a normalised, relative member name, or ``None`` if the name
+    refers outside of the archive."""
+    name = posixpath.normpath(
+        force_text(name, errors='replace').replace('\\', '/')).lstrip('/')
+    if name in ('', '.', '..') or name.startswith('../'):
+        return None
+    return name
+
+
+def get_put_pool():
+    """Return the shared thread pool used for uploading archive members."""
+    global _put_pool
+    with _lock:
+        if _put_pool is None:
+            from multiprocessing.pool import ThreadPool
+            _put_pool = ThreadPool(
+                processes=settings.ARCHIVE_PUT_CONCURRENCY)
+    return _put_pool
+
+
+def get_put_slots():
+    """Return the slots limiting the number of archive members which may be
+    queued or uploading at once, across all archives."""
+    global _put_slots
+    with _lock:
+        if _put_slots is None:
+            _put_slots = threading.BoundedSemaphore(
+                settings.ARCHIVE_PUT_CONCURRENCY)
+    return _put_slots
+
+
+def iter_tar_members(fileobj, max_member_size):
+    """Yield the name, size and content (up to one byte more than the maximum
+    size) of each file in a (stream of a) tar archive, in order."""
+    import tarfile
+    import zlib
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, archive.extractfile(
+                        member).read(max_member_size + 1)
+    except (EOFError, tarfile.TarError, zlib.error) as error:
+        raise ArchiveError('Invalid tar archive: {0}'.format(error))
+
+
+def iter_zip_members(fileobj, max_member_size):
+    """Yield the name, size and content (up to one byte more than the maximum
+    size) of each file in a zip archive, in order, after spooling the
+    archive."""
+    import shutil
+    import tempfile
+    import zipfile
+    import zlib
+    with tempfile.SpooledTemporaryFile(
+            max_size=settings.ARCHIVE_SPOOL_SIZE) as spool:
+        shutil.copyfileobj(fileobj, spool, CHUNK_SIZE)
+        spool.seek(0)
+        try:
+            archive = zipfile.ZipFile(spool)
+            for info in archive.infolist():
+                if not info.filename.endswith('/'):
+                    yield info.filename, info.file_size, archive.open(
+                        info).read(max_member_size + 1)
+        # Encrypted members raise RuntimeError, and unsupported compression
+        # methods NotImplementedError.
+        except (NotImplementedError, RuntimeError, zipfile.BadZipfile,
+                zipfile.LargeZipFile, zlib.error) as error:
+            raise ArchiveError('Invalid zip archive: {0}'.format(error))
+
+
+def put_member(slots, bucket, key_name, content, content_type, acl):
+    """Upload a member (in a pool thread), releasing its slot when done."""
+    try:
+        key = bucket.new_key(key_name)
+        resilience.call(lambda: key.set_contents_from_string(
+            content, headers={'Content-Type': content_type}, policy=acl))
+        return key
+    finally:
+        slots.release()
+
+
+def expand_archive(key, content_type, content_type_prefix, key_name_generator,
+                   acl, sniff_size=1024):
+    """Expand an archive in a bucket into a file for each member.
+
+    :param key: Key (object) of the archive.
+    :param content_type: Content type of the archive.
+    :param content_type_prefix: Prefix which the (sniffed) content type of
+        each member must start with.
+    :param key_name_generator: Callable accepting a member name, returning the
+        key name to upload the member to.
+    :param acl: Acl to set on the uploaded members.
+    :param sniff_size: Number of bytes used to sniff the content type of each
+        member.
+    :returns: Manifest of the members, in archive order. Each is a dictionary
+        of ``name``, ``size`` and ``content_type``, and either the ``key``
+        name it was uploaded to, or the ``error`` for which it was skipped
+        (only the first of any members with the same name is uploaded).
+    :rtype: :py:class:`list`
+
+    """
+
+    if content_type not in ARCHIVE_CONTENT_TYPES:
+        raise ArchiveError('Unsupported archive type: {0}'.format(
+            content_type))
+
+    bucket = key.bucket
+    max_members = settings.ARCHIVE_MAX_MEMBERS
+    max_member_size = settings.ARCHIVE_MAX_MEMBER_SIZE
+    max_size = settings.ARCHIVE_MAX_SIZE
+    pool = get_put_pool()
+    slots = get_put_slots()
+
+    # Only read the version of the archive which was validated
+    archive = bucket.new_key(key.name)
+    resilience.call(lambda: archive.open_read(
+        headers={'If-Match': key.etag}))
+    if content_type == 'application/zip':
+        members = iter_zip_members(archive, max_member_size)
+    else:
+        members = iter_tar_members(archive, max_member_size)
+
+    manifest = []
+    key_names = set()
+    results = []
+    total_size = 0
+    try:
+        for name, size, content in members:
+            if len(manifest) >= max_members:
+                raise ArchiveError('Archive has too many members.')
+            # The size is read from the archive, so is also checked against
+            # the content.
+            total_size += len(content)
+            if max(size, len(content)) > max_member_size:
+                raise ArchiveError('Archive member is too large.')
+            if total_size > max_size:
+                raise ArchiveError('Archive is too large.')
+
+            cleaned_name = clean_member_name(name)
+            member_content_type = get_magic().from_buffer(content[:sniff_size])
+            entry = {'name': cleaned_name or force_text(
+                         name, errors='replace'),
+                     'size': len(content),
+                     'content_type': member_content_type}
+            manifest.append(entry)
+            key_name = cleaned_name and key_name_generator(cleaned_name)
+            if not cleaned_name:
+                entry['error'] = 'Name does not validate.'
+            elif key_name in key_names:
+                entry['error'] = 'Name is a duplicate.'
+            elif not member_content_type.startswith(content_type_prefix):
+                entry['error'] = 'Content-Type does not validate.'
+            else:
+                entry['key'] = key_name
+                key_names.add(key_name)
+                slots.acquire()
+                results.append(pool.apply_async(put_member, (
+                    slots, bucket, entry['key'], content,
+                    member_content_type, acl)))
+        for result in results:
+            result.get()
+    except Exception:
+        # Wait for any uploads in progress, then remove all of the members
+        # which were uploaded, re-raising the original error.
+        exc_info = sys.exc_info()
+        for result in results:
+            result.wait()
+        delete_keys(bucket, [entry['key'] for entry in manifest
+                             if 'key' in entry])
+        six.reraise(*exc_info)
+    finally:
+        archive.close()
+
+    return manifest
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""SHA-256 checksums of uploads, computed by the client and verified by S3.
+
+The client sends the checksum with the upload (``x-amz-checksum-sha256``), and
+S3 rejects the upload if it does not match the content received. S3 only
+returns the checksum when asked (``x-amz-checksum-mode: ENABLED``), and boto 2
+does not keep it on the key, so the upload key is requested with
+:py:class:`ChecksumKey` as the key class.
+
+This module imports boto, so is only imported when checksums are required.
+
+"""
+
+
+from __future__ import absolute_import, unicode_literals
+from boto.s3.bucket import Bucket
+from boto.s3.key import Key
+
+
+CHECKSUM_HEADER = 'x-amz-checksum-sha256'
+
+
+class ChecksumKey(Key):
+    """Key which keeps the SHA-256 checksum returned by S3, if any."""
+
+    checksum_sha256 = None
+    """Base64 encoded SHA-256 checksum of the content."""
+
+    def handle_addl_headers(self, headers):
+        super(ChecksumKey, self).handle_addl_headers(headers)
+        for name, value in headers:
+            if name.lower() == CHECKSUM_HEADER:
+                self.checksum_sha256 = value
+
+
+def get_checksum_bucket(storage):
+    """Return the storage's bucket, using :py:class:`ChecksumKey` for keys.
+
+    :returns: Bucket (object), which is not validated.
+    :rtype: :py:class:`boto.s3.bucket.Bucket`
+
+    """
+
+    return Bucket(storage.connection, storage.bucket_name,
+                  key_class=ChecksumKey)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Generation of derivative files (e.g. thumbnails) from processed uploads.
+
+Derivatives are generated in the background (see :py:func:`submit`), so that
+the response to the upload is not delayed. At most
+``S3UPLOAD_DERIVATIVE_QUEUE_DEPTH`` uploads may have derivatives being
+generated at once, each in a thread of a shared pool of that size. If no slot
+becomes free within ``S3UPLOAD_DERIVATIVE_QUEUE_TIMEOUT`` seconds, the
+derivatives are not generated, rather than queueing an unbounded amount of
+work.
+
+Renderers are run in a shared pool of ``S3UPLOAD_DERIVATIVE_PROCESSES``
+processes, so that CPU-bound renderers do not hold the GIL of the server
+process. Forking from a request thread of a threaded server is unsafe, so the
+pool is started with Django (see :py:class:`s3upload.apps.S3UploadConfig`),
+before any requests are served, and renderers must be importable to be sent to
+it. If the setting is ``0`` (the default), or the server process was forked
+after the pool was started, renderers are run in the background thread
+instead. The resulting files are uploaded concurrently from a shared pool of
+``S3UPLOAD_DERIVATIVE_UPLOAD_THREADS`` threads. If any derivative cannot be
+rendered or uploaded, the derivatives already uploaded are deleted.
+
+A renderer is a module-level function (or a dotted path to one) accepting the
+content and content type of the processed file, and returning a
+``(content, content_type)`` tuple, or ``None`` if no derivative should be
+created.
+
+"""
+
+
+from __future__ import absolute_import, unicode_literals
+from . import resilience
+from .settings import settings
+from importlib import import_module
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+_background_pool = None
+
+_queue_slots = None
+
+_render_pool = None
+
+_render_pool_pid = None
+
+_upload_pool = None
+
+
+class DerivativeError(Exception):
+    """Derivatives could not be generated."""
+
+
+class QueueSlots(object):
+    """A counting semaphore, which can be acquired with a timeout (unlike
+    :py:class:`threading.Semaphore` on Python 2)."""
+
+    def __init__(self, value):
+        self._value = value
+        self._condition = threading.Condition(threading.Lock())
+
+    def acquire(self, timeout=None):
+        """Acquire a slot, waiting for up to ``timeout`` seconds.
+
+        :returns: Whether a slot was acquired.
+        :rtype: :py:class:`bool`
+
+        """
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._value <= 0:
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self._value -= 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self._value += 1
+            self._condition.notify()
+
+
+def delete_keys(bucket, key_names):
+    """Delete keys from a bucket, logging (rather than raising) any error, so
+    that cleaning up after a failure does not hide the original error."""
+    try:
+        if key_names:
+            resilience.call(lambda: bucket.delete_keys(key_names, quiet=True))
+    except Exception:
+        logger.exception('Could not delete keys: %s', ', '.join(key_names))
+
+
+def get_background_pool():
+    """Return the shared thread pool in which derivatives are generated."""
+    global _background_pool
+    with _lock:
+        if _background_pool is None:
+            from multiprocessing.pool import ThreadPool
+            _background_pool = ThreadPool(
+                processes=settings.DERIVATIVE_QUEUE_DEPTH)
+    return _background_pool
+
+
+def get_queue_slots():
+    """Return the slots limiting the number of uploads which may have
+    derivatives being generated at once.
+
+    A burst of uploads will wait (for a limited time) for a slot, rather than
+    queueing an unbounded amount of work for the background pool.
+
+    """
+
+    global _queue_slots
+    with _lock:
+        if _queue_slots is None:
+            _queue_slots = QueueSlots(settings.DERIVATIVE_QUEUE_DEPTH)
+    return _queue_slots
+
+
+def get_render_pool():
+    """Return the shared process pool used for rendering derivatives, or
+    ``None`` if it was not started in this process."""
+    if _render_pool_pid == os.getpid():
+        return _render_pool
+    return None
+
+
+def get_upload_pool():
+    """Return the shared thread pool used for uploading derivatives."""
+    global _upload_pool
+    with _lock:
+        if _upload_pool is None:
+            from multiprocessing.pool import ThreadPool
+            _upload_pool = ThreadPool(
+                processes=settings.DERIVATIVE_UPLOAD_THREADS)
+    return _upload_pool
+
+
+def start_render_pool(processes=None):
+    """Start the shared process pool used for rendering derivatives.
+
+    Must be called before the server starts any threads (e.g. when Django
+    starts), as the pool forks the current process.
+
+    :param processes: Number of processes, by default
+        ``S3UPLOAD_DERIVATIVE_PROCESSES``.
+    :rtype: :py:class:`multiprocessing.pool.Pool`
+
+    """
+
+    global _render_pool, _render_pool_pid
+    with _lock:
+        if _render_pool_pid != os.getpid():
+            from multiprocessing import Pool
+            _render_pool = Pool(
+                processes=processes or settings.DERIVATIVE_PROCESSES)
+            _render_pool_pid = os.getpid()
+    return _render_pool
+
+
+def render(renderer, content, content_type):
+    """Run a renderer (in a pool process)."""
+    if not callable(renderer):
+        module_name, attribute_name = renderer.rsplit('.', 1)
+        renderer = getattr(import_module(module_name), attribute_name)
+    return renderer(content, content_type)
+
+
+def run(function, args):
+    """Run a function (in a background thread), then release its slot."""
+    try:
+        return function(*args)
+    finally:
+        get_queue_slots().release()
+
+
+def submit(function, *args):
+    """Run a function in the background, holding a queue slot until it
+    returns.
+
+    :returns: Result of the function (use ``get()`` to wait for it).
+    :rtype: :py:class:`multiprocessing.pool.AsyncResult`
+    :raises DerivativeError: If the queue is full.
+
+    """
+
+    slots = get_queue_slots()
+    if not slots.acquire(timeout=settings.DERIVATIVE_QUEUE_TIMEOUT):
+        raise DerivativeError('Derivative queue is full.')
+    try:
+        return get_background_pool().apply_async(run, (function, args))
+    except Exception:
+        slots.release()
+        raise
+
+
+def generate_derivatives(bucket, content, content_type, derivatives,
+                         key_name_generator, acl):
+    """Render derivatives of the given content, and upload them to a bucket.
+
+    Either all of the (non-``None``) derivatives are uploaded, or none are.
+
+    :param bucket: Bucket to upload the derivatives to.
+    :param content: Content of the processed file.
+    :param content_type: Content type of the processed file.
+    :param derivatives: Mapping of derivative names to renderers.
+    :param key_name_generator: Callable accepting a derivative name and
+        content type, returning the key name to upload the derivative to.
+    :param acl: Acl to set on the uploaded derivatives.
+    :returns: Dictionary of derivative names to keys (objects).
+    :rtype: :py:class:`dict`
+
+    """
+
+    pool = get_render_pool()
+    if pool is None:
+        rendered = [(name, render(renderer, content, content_type))
+                    for name, renderer in derivatives.items()]
+    else:
+        results = [(name, pool.apply_async(render,
+                                           (renderer, content, content_type)))
+                   for name, renderer in derivatives.items()]
+        # Wait for all of the renderers, even if one of them fails, so that
+        # the content is not still queued once the slot is released.
+        for name, result in results:
+            result.wait()
+        rendered = [(name, result.get()) for name, result in results]
+
+    def upload(name, derivative_content, derivative_content_type):
+        key = bucket.new_key(
+            key_name_generator(name, derivative_content_type))
+        resilience.call(lambda: key.set_contents_from_string(
+            derivative_content,
+            headers={'Content-Type': derivative_content_type}, policy=acl))
+        return key
+
+    pool = get_upload_pool()
+    results = [(name, pool.apply_async(upload, (name,) + tuple(derivative)))
+               for name, derivative in rendered if derivative is not None]
+    for name, result in results:
+        result.wait()
+    keys = dict((name, result.get()) for name, result in results
+                if result.successful())
+    failed = [result for name, result in results if not result.successful()]
+    if failed:
+        delete_keys(bucket, [key.name for key in keys.values()])
+        failed[0].get()
+    return keys
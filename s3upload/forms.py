@@ -16,14 +16,81 @@
 
 
 from __future__ import absolute_import, unicode_literals
-from . import settings
+from . import resilience
+from .settings import settings
 from datetime import datetime
 from django import forms
 from django.core.files.storage import default_storage
+from django.utils.text import get_valid_filename
 from hashlib import md5, sha1
-from magic import Magic
+import base64
+import calendar
 import hmac
+import logging
+import math
+import mimetypes
 import os
+import threading
+import time
+import uuid
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+_magic = None
+
+_magic_lock = threading.Lock()
+
+
+def get_magic():
+    """Return a shared (mime type) :py:class:`magic.Magic` instance.
+
+    libmagic and its database are only loaded on first use, rather than when
+    this module is imported.
+
+    """
+
+    global _magic
+    with _magic_lock:
+        if _magic is None:
+            from magic import Magic
+            _magic = Magic(mime=True)
+    return _magic
+
+
+class ChecksumMixin(object):
+
+    require_checksum = False
+    """Require a SHA-256 checksum of each upload, computed by the client and
+    verified by S3 (see :py:mod:`s3upload.checksums`)."""
+
+    def __init__(self, require_checksum=None, **kwargs):
+        if require_checksum is not None:
+            self.require_checksum = require_checksum
+        return super(ChecksumMixin, self).__init__(**kwargs)
+
+    def get_require_checksum(self):
+        return self.require_checksum
+
+
+class CompressionMixin(object):
+
+    compress_content_types = ()  # e.g. ['text/', 'application/json']
+
+    def __init__(self, compress_content_types=None, **kwargs):
+        if compress_content_types is not None:
+            self.compress_content_types = compress_content_types
+        return super(CompressionMixin, self).__init__(**kwargs)
+
+    def get_compress_content_types(self):
+        return self.compress_content_types
+
+    def is_compressible(self, content_type):
+        """Return whether files of the content type may be uploaded gzip
+        compressed."""
+        return any(content_type.startswith(prefix)
+                   for prefix in self.get_compress_content_types())
 
 
 class ContentTypePrefixMixin(object):
@@ -39,6 +106,64 @@ class ContentTypePrefixMixin(object):
         return self.content_type_prefix
 
 
+class ExpirationMixin(object):
+
+    expiration_resolution = None  # e.g. timedelta(minutes=5)
+    """Round the expiration time up to a multiple of this, so that identical
+    forms created within the same period share a policy and signature."""
+
+    expiration_timedelta = None  # Defaults to S3UPLOAD_EXPIRATION_TIMEDELTA
+
+    def __init__(self, expiration_resolution=None, **kwargs):
+        if expiration_resolution is not None:
+            self.expiration_resolution = expiration_resolution
+        return super(ExpirationMixin, self).__init__(**kwargs)
+
+    def get_expiration_time(self, refresh=False):
+        if not hasattr(self, '_expiration_time') and not refresh:
+            expiration_datetime = datetime.utcnow() + \
+                self.get_expiration_timedelta()
+            self._expiration_time = expiration_datetime.timetuple()
+            resolution = self.get_expiration_resolution()
+            if resolution:
+                seconds = resolution.total_seconds()
+                timestamp = calendar.timegm(self._expiration_time)
+                self._expiration_time = time.gmtime(
+                    math.ceil(timestamp / seconds) * seconds)
+        return self._expiration_time
+
+    def get_expiration_resolution(self):
+        return self.expiration_resolution
+
+    def get_expiration_timedelta(self):
+        if self.expiration_timedelta is not None:
+            return self.expiration_timedelta
+        return settings.EXPIRATION_TIMEDELTA
+
+
+class FileSizeMixin(object):
+
+    min_file_size = 0  # bytes
+
+    max_file_size = None  # bytes, e.g. 10 * 1024 * 1024
+
+    max_post_file_size = 5 * 1024 * 1024 * 1024
+    """Largest file size permitted by S3 for a single HTTP POST upload."""
+
+    def __init__(self, min_file_size=None, max_file_size=None, **kwargs):
+        if min_file_size is not None:
+            self.min_file_size = min_file_size
+        if max_file_size is not None:
+            self.max_file_size = max_file_size
+        return super(FileSizeMixin, self).__init__(**kwargs)
+
+    def get_max_file_size(self):
+        return self.max_file_size
+
+    def get_min_file_size(self):
+        return self.min_file_size
+
+
 class KeyPrefixMixin(object):
 
     upload_to = 'incoming/'  # e.g. 'foo/bar/'
@@ -65,8 +190,8 @@ class StorageMixin(object):
         return self.storage
 
 
-class S3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin, StorageMixin,
-                   forms.Form):
+class S3UploadForm(ContentTypePrefixMixin, ExpirationMixin, FileSizeMixin,
+                   KeyPrefixMixin, StorageMixin, forms.Form):
     """Form for uploading a file directly to an S3 bucket."""
 
     access_key = forms.CharField(widget=forms.HiddenInput())
@@ -92,8 +217,6 @@ class S3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin, StorageMixin,
     # Any fields below it are ignored.
     file = forms.FileField()
 
-    expiration_timedelta = settings.EXPIRATION_TIMEDELTA
-
     field_name_overrides = {'cache_control': 'Cache-Control',
                             'content_type': 'Content-Type',
                             'access_key': 'AWSAccessKeyId'}
@@ -173,6 +296,16 @@ class S3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin, StorageMixin,
                 self.get_success_action_status_code()),
         ]
 
+        # Only limit the file size if a minimum or maximum is provided
+        min_file_size = self.get_min_file_size()
+        max_file_size = self.get_max_file_size()
+        if min_file_size or max_file_size:
+            conditions += [
+                '["content-length-range", {0}, {1}]'.format(
+                    min_file_size or 0,
+                    max_file_size or self.max_post_file_size)
+            ]
+
         # Only render Cache-Control if a value is provided
         cache_control = self.get_cache_control()
         if cache_control:
@@ -193,21 +326,18 @@ class S3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin, StorageMixin,
     def get_connection(self):
         return self.get_storage().connection
 
-    def get_expiration_time(self, refresh=False):
-        if not hasattr(self, '_expiration_time') and not refresh:
-            expiration_datetime = datetime.utcnow() + self.expiration_timedelta
-            self._expiration_time = expiration_datetime.timetuple()
-        return self._expiration_time
-
     def get_key(self):
         return '{0}${{filename}}'.format(self.get_key_prefix())
 
     def get_policy(self):
         # http://docs.aws.amazon.com/AmazonS3/latest/dev/HTTPPOSTForms.html#HTTPPOSTConstructPolicy
-        connection = self.get_connection()
-        policy = connection.build_post_policy(self.get_expiration_time(),
-                                              self.get_conditions())
-        return self._base64_encode(policy.replace('\n', '').encode('utf-8'))
+        if not hasattr(self, '_policy'):
+            connection = self.get_connection()
+            policy = connection.build_post_policy(self.get_expiration_time(),
+                                                  self.get_conditions())
+            self._policy = self._base64_encode(
+                policy.replace('\n', '').encode('utf-8'))
+        return self._policy
 
     def get_signature(self):
         # http://docs.aws.amazon.com/AmazonS3/latest/dev/HTTPPOSTForms.html#HTTPPOSTConstructingPolicySignature
@@ -226,18 +356,170 @@ class S3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin, StorageMixin,
         return self.success_action_status_code
 
 
-class DropzoneS3UploadForm(S3UploadForm):
-    """Form for uploading a file directly to an S3 bucket using dropzone.js."""
+class DropzoneS3UploadForm(ChecksumMixin, CompressionMixin, S3UploadForm):
+    """Form for uploading a file directly to an S3 bucket using dropzone.js.
+
+    If ``compress_content_types`` are provided, files of those content types
+    are gzip compressed in the browser (where supported) before uploading, and
+    uploaded with a ``Content-Encoding`` of ``gzip`` (other files are uploaded
+    with ``identity``).
+
+    If ``require_checksum`` is set, the SHA-256 checksum of each file is
+    computed in the browser (in a Web Worker), and verified by S3.
+
+    """
 
     success_action_status_code = 201
 
+    def get_conditions(self):
+        conditions = super(DropzoneS3UploadForm, self).get_conditions()
+
+        # Content-Encoding is set for each file by dropzone-options.js, and
+        # checked by ValidateS3UploadForm.
+        if self.get_compress_content_types():
+            conditions += ['["starts-with", "$Content-Encoding", ""]']
+
+        # The checksum is computed for each file by dropzone-options.js, and
+        # S3 rejects the upload if it does not match the content.
+        if self.get_require_checksum():
+            conditions += ['{"x-amz-checksum-algorithm": "SHA256"}',
+                           '["starts-with", "$x-amz-checksum-sha256", ""]']
+
+        return conditions
+
     class Media(object):
         css = {'all': ['s3upload/css/dropzone.css']}
         js = ['s3upload/dropzone.js', 's3upload/dropzone-options.js']
 
 
-class ValidateS3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin,
-                           StorageMixin, forms.Form):
+class PresignS3UploadForm(ChecksumMixin, ContentTypePrefixMixin,
+                          ExpirationMixin, FileSizeMixin, KeyPrefixMixin,
+                          StorageMixin, forms.Form):
+    """Form used to sign a PUT request for uploading a single file directly to
+    an S3 bucket.
+
+    Not for use in templates - a client (e.g. using ``fetch``) requests
+    presigned uploads, then PUTs each file to its URL with the returned
+    headers. The upload is validated and processed by
+    :py:class:`ValidateS3UploadForm`, as for a POST upload.
+
+    """
+
+    checksum_sha256 = forms.CharField(max_length=44, required=False)
+    """Base64 encoded SHA-256 checksum of the file to upload, which is signed
+    and verified by S3."""
+
+    content_type = forms.CharField(max_length=255)
+    """Content type of the file to upload."""
+
+    filename = forms.CharField(max_length=255, required=False)
+    """Name of the file to upload, used for its extension."""
+
+    size = forms.IntegerField(min_value=0)
+    """Size of the file to upload, in bytes."""
+
+    def clean_checksum_sha256(self):
+        """Validates that a checksum is provided, if required, and is a
+        base64 encoded SHA-256 digest."""
+        checksum = self.cleaned_data['checksum_sha256']
+        if not checksum and self.get_require_checksum():
+            raise forms.ValidationError('Checksum is required.')
+        if checksum:
+            try:
+                valid = len(base64.b64decode(checksum.encode('ascii'))) == 32
+            except (TypeError, ValueError):
+                valid = False
+            if not valid:
+                raise forms.ValidationError('Checksum does not validate.')
+        return checksum
+
+    def clean_content_type(self):
+        """Validates that the content type starts with the required prefix."""
+        content_type = self.cleaned_data['content_type']
+        if not content_type.startswith(self.get_content_type_prefix()):
+            raise forms.ValidationError('Content-Type does not validate.')
+        return content_type
+
+    def clean_size(self):
+        """Validates that the size is within the permitted range.
+
+        S3 does not enforce the size of a presigned PUT, so this is checked
+        again when validating the upload.
+
+        """
+
+        size = self.cleaned_data['size']
+        max_file_size = self.get_max_file_size() or self.max_post_file_size
+        if size < self.get_min_file_size() or size > max_file_size:
+            raise forms.ValidationError('File size does not validate.')
+        return size
+
+    def get_acl(self):
+        """Return the acl to be set on the uploaded file (see
+        :py:meth:`S3UploadForm.get_acl`)."""
+        return 'private'
+
+    def get_connection(self):
+        return self.get_storage().connection
+
+    def get_headers(self):
+        """Return the headers which must be sent with the PUT request."""
+        headers = {'Content-Type': self.cleaned_data['content_type'],
+                   'x-amz-acl': self.get_acl()}
+        checksum = self.cleaned_data.get('checksum_sha256')
+        if checksum:
+            headers.update({'x-amz-checksum-sha256': checksum})
+        cache_control = self.get_storage().headers.get('Cache-Control', '')
+        if cache_control:
+            headers.update({'Cache-Control': cache_control})
+        return headers
+
+    def get_key(self):
+        """Return a new, unique key name under the key prefix."""
+        if not hasattr(self, '_key'):
+            filename = os.path.basename(self.cleaned_data.get('filename', ''))
+            filename = get_valid_filename(filename) or 'upload'
+            self._key = '{0}{1}/{2}'.format(self.get_key_prefix(),
+                                            uuid.uuid4().hex, filename)
+        return self._key
+
+    def get_upload(self):
+        """Return the presigned upload, for the client.
+
+        :returns: Dictionary of ``bucket``, ``key``, ``method``, ``url``,
+            ``headers`` and ``expires`` (timestamp).
+        :rtype: :py:class:`dict`
+
+        """
+
+        expires = calendar.timegm(self.get_expiration_time())
+        return {
+            'bucket': self.get_bucket_name(),
+            'key': self.get_key(),
+            'method': 'PUT',
+            'url': self.get_url(),
+            'headers': self.get_headers(),
+            'expires': expires,
+        }
+
+    def get_url(self):
+        """Return the presigned PUT url.
+
+        Signed (``x-amz-``) headers are also included in the querystring.
+
+        """
+
+        storage = self.get_storage()
+        expires_in = calendar.timegm(self.get_expiration_time()) - time.time()
+        return self.get_connection().generate_url(
+            int(math.ceil(expires_in)), 'PUT', bucket=self.get_bucket_name(),
+            key=self.get_key(), headers=self.get_headers(),
+            force_http=not storage.secure_urls)
+
+
+class ValidateS3UploadForm(ChecksumMixin, CompressionMixin,
+                           ContentTypePrefixMixin, FileSizeMixin,
+                           KeyPrefixMixin, StorageMixin, forms.Form):
     """Form used to validate returned data from S3.
 
     Not for use in templates - we're only processing/validating the provided
@@ -257,10 +539,27 @@ class ValidateS3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin,
     process_to = 'processed/'  # e.g. 'foo/bar/'
     """Path to place processed files in."""
 
+    sniff_size = 1024
+    """Number of bytes to read from the start of the upload to determine its
+    actual content type."""
+
+    derivatives = {}  # e.g. {'thumbnail': 'myapp.renderers.thumbnail'}
+    """Mapping of derivative names to renderers, see
+    :py:mod:`s3upload.derivatives`."""
+
+    expand_archives = False
+    """Expand an uploaded zip or tar archive into a processed file for each
+    member, see :py:mod:`s3upload.archives`. The content type prefix then
+    applies to the members, rather than the archive."""
+
     def __init__(self, process_to=None, processed_key_generator=None,
-                 **kwargs):
+                 derivatives=None, expand_archives=None, **kwargs):
         if process_to is not None:
             self.process_to = process_to
+        if derivatives is not None:
+            self.derivatives = derivatives
+        if expand_archives is not None:
+            self.expand_archives = expand_archives
         if processed_key_generator is not None:
             self._generate_processed_key_name = processed_key_generator
         return super(ValidateS3UploadForm, self).__init__(**kwargs)
@@ -280,13 +579,39 @@ class ValidateS3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin,
             # Ensure key and etag match
             if not key.etag == self.cleaned_data['etag']:
                 raise forms.ValidationError('Etag does not validate.')
-            # Ensure initial content type starts with prefix
-            if not key.content_type.startswith(self.get_content_type_prefix()):
-                raise forms.ValidationError('Content-Type does not validate.')
-            # Ensure actual content type starts with prefix
-            content_type = self.get_upload_content_type()
-            if not content_type.startswith(self.get_content_type_prefix()):
-                raise forms.ValidationError('Content-Type does not validate.')
+            # Ensure the upload was verified by S3, if required
+            if self.get_require_checksum() and not self.get_upload_checksum():
+                raise forms.ValidationError('Checksum does not validate.')
+            # Ensure size is within the permitted range
+            max_file_size = self.get_max_file_size()
+            if key.size < self.get_min_file_size() or (
+                    max_file_size and key.size > max_file_size):
+                raise forms.ValidationError('File size does not validate.')
+            if self.get_expand_archives():
+                # Ensure actual content type is a supported archive
+                from .archives import ARCHIVE_CONTENT_TYPES
+                content_type = self.get_upload_content_type()
+                if content_type not in ARCHIVE_CONTENT_TYPES:
+                    raise forms.ValidationError(
+                        'Content-Type does not validate.')
+            else:
+                # Ensure initial content type starts with prefix
+                if not key.content_type.startswith(
+                        self.get_content_type_prefix()):
+                    raise forms.ValidationError(
+                        'Content-Type does not validate.')
+                # Ensure actual content type starts with prefix
+                content_type = self.get_upload_content_type()
+                if not content_type.startswith(
+                        self.get_content_type_prefix()):
+                    raise forms.ValidationError(
+                        'Content-Type does not validate.')
+            # Ensure only compressible content types are compressed
+            if key.content_encoding not in (None, '', 'identity') and not (
+                    key.content_encoding == 'gzip' and
+                    self.is_compressible(content_type)):
+                raise forms.ValidationError(
+                    'Content-Encoding does not validate.')
         return self.cleaned_data
 
     def clean_bucket_name(self):
@@ -309,6 +634,49 @@ class ValidateS3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin,
             raise forms.ValidationError('Key does not exist.')
         return key
 
+    def decompress(self, content):
+        """Decompress gzip compressed content, which may be truncated.
+
+        :raises ValidationError: If the content decompresses to more than the
+            maximum decompressed size.
+
+        """
+
+        max_size = self.get_max_decompressed_size()
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        content = decompressor.decompress(content, max_size + 1)
+        if decompressor.unconsumed_tail or len(content) > max_size:
+            raise forms.ValidationError('File size does not validate.')
+        return content
+
+    def get_derivative_key_name(self, name, content_type):
+        """Return the full path to use for a derivative of the processed
+        file, based on the processed key name."""
+        processed_key_name = self.get_processed_key_name()
+        root, extension = os.path.splitext(processed_key_name)
+        if mimetypes.guess_type(processed_key_name)[0] != content_type:
+            extension = mimetypes.guess_extension(content_type) or extension
+        return '{0}_{1}{2}'.format(root, name, extension)
+
+    def get_archive_member_key_name(self, name):
+        """Return the full path to use for a member of an expanded archive,
+        under the processed key name (without its extension)."""
+        root, extension = os.path.splitext(self.get_processed_key_name())
+        return '{0}/{1}'.format(root.rstrip('.'), name)
+
+    def get_derivatives(self):
+        """Return the mapping of derivative names to renderers."""
+        return self.derivatives
+
+    def get_expand_archives(self):
+        return self.expand_archives
+
+    def get_max_decompressed_size(self):
+        """Return the maximum size of a gzip compressed upload, once
+        decompressed: the maximum file size, if any, or
+        ``S3UPLOAD_MAX_DECOMPRESSED_SIZE``."""
+        return self.get_max_file_size() or settings.MAX_DECOMPRESSED_SIZE
+
     def get_processed_acl(self):
         """Return the acl to be set on the processed file."""
         return self.get_storage().default_acl
@@ -333,8 +701,102 @@ class ValidateS3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin,
         location = self.get_storage().location
         return self.get_processed_key_name()[len(location):]
 
+    def get_processed_url(self):
+        """Returns a signed url for the processed file, see
+        :py:mod:`s3upload.signing`.
+
+        :returns: Url of the processed file.
+        :rtype: :py:class:`unicode`
+
+        """
+
+        from .signing import get_signer
+        return get_signer(self.get_storage()).url(self.get_processed_path())
+
+    def process_derivatives(self, processed_key, content_type=None):
+        """Generate derivatives of the processed file in the background,
+        and upload them.
+
+        The processed file is read once, and each of the derivatives are
+        rendered in the render pool (see :py:mod:`s3upload.derivatives`). The
+        upload has already been processed, so if the derivatives cannot be
+        generated, the error is logged rather than raised.
+
+        :param processed_key: Key (object) of the processed file.
+        :param content_type: Content type of the processed file, by default
+            the actual content type of the upload.
+        :returns: Result (use ``get()`` to wait for it) of a dictionary of
+            derivative names to keys (objects), which is empty if the
+            derivatives could not be generated, or ``None`` if the derivative
+            queue is full.
+        :rtype: :py:class:`multiprocessing.pool.AsyncResult`
+
+        """
+
+        from .derivatives import DerivativeError, submit
+        if content_type is None:
+            content_type = self.get_upload_content_type()
+        try:
+            return submit(self._process_derivatives, processed_key,
+                          content_type)
+        except DerivativeError:
+            logger.warning('Derivative queue is full, not generating '
+                           'derivatives of %s', processed_key.name)
+            return None
+    process_derivatives.alters_data = True
+
+    def _process_derivatives(self, processed_key, content_type):
+        # Run in a background thread, by process_derivatives
+        from .derivatives import generate_derivatives
+        try:
+            content = resilience.call(processed_key.get_contents_as_string)
+            if self.get_upload_key().content_encoding == 'gzip':
+                content = self.decompress(content)
+            return generate_derivatives(
+                processed_key.bucket, content, content_type,
+                self.get_derivatives(), self.get_derivative_key_name,
+                self.get_processed_acl())
+        except Exception:
+            logger.exception('Could not generate derivatives of %s',
+                             processed_key.name)
+            return {}
+
+    def process_archive(self):
+        """Expand the uploaded archive into a processed file for each member,
+        and delete the archive.
+
+        :returns: Manifest of the archive members, see
+            :py:func:`s3upload.archives.expand_archive`.
+        :rtype: :py:class:`list`
+
+        """
+
+        from .archives import expand_archive
+        upload_key = self.get_upload_key()
+        self.manifest = expand_archive(
+            upload_key, self.get_upload_content_type(),
+            self.get_content_type_prefix(), self.get_archive_member_key_name,
+            self.get_processed_acl(), sniff_size=self.sniff_size)
+        resilience.call(upload_key.delete)
+        return self.manifest
+    process_archive.alters_data = True
+
     def process_upload(self, set_content_type=True):
-        """Process the uploaded file."""
+        """Process the uploaded file.
+
+        Derivatives are generated separately, by
+        :py:meth:`process_derivatives` with the processed key.
+
+        :returns: Key (object) of the processed file, or if expanding
+            archives, the manifest of the archive members.
+        :raises ValidationError: If the upload has changed since it was
+            validated (the error is also added to the form).
+
+        """
+
+        if self.get_expand_archives():
+            return self.process_archive()
+
         metadata = self.get_upload_key_metadata()
 
         if set_content_type:
@@ -342,20 +804,62 @@ class ValidateS3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin,
             metadata.update({b'Content-Type': b'{0}'.format(content_type)})
 
         upload_key = self.get_upload_key()
-        processed_key_name = self.get_processed_key_name()
-        processed_key = upload_key.copy(upload_key.bucket.name,
-                                        processed_key_name, metadata)
-        processed_key.set_acl(self.get_processed_acl())
-        upload_key.delete()
+        bucket = upload_key.bucket
+
+        # Set the acl in the same request as the copy, and only copy if the
+        # upload has not changed since it was validated.
+        headers = {'x-amz-acl': self.get_processed_acl(),
+                   'x-amz-copy-source-if-match': upload_key.etag}
+
+        # Keep the checksum (verified by S3) with the processed file
+        checksum = self.get_upload_checksum()
+        if checksum:
+            metadata.update({b'sha256': b'{0}'.format(checksum)})
+            headers.update({'x-amz-checksum-algorithm': 'SHA256'})
+
+        try:
+            processed_key = resilience.call(lambda: bucket.copy_key(
+                self.get_processed_key_name(), bucket.name, upload_key.name,
+                metadata=metadata, headers=headers))
+        except Exception as error:
+            # The upload was replaced after it was validated
+            if getattr(error, 'status', None) != 412:
+                raise
+            error = forms.ValidationError('Etag does not validate.')
+            self.add_error(None, error)
+            raise error
+        resilience.call(upload_key.delete)
         return processed_key
     process_upload.alters_data = True
 
     def get_upload_content_type(self):
         """Determine the actual content type of the upload."""
         if not hasattr(self, '_upload_content_type'):
-            with self.get_storage().open(self.get_upload_path()) as upload:
-                content_type = Magic(mime=True).from_buffer(upload.read(1024))
-            self._upload_content_type = content_type
+            key = self.get_upload_key()
+            # Only the start of the file is needed (and S3 would reject a
+            # range request for an empty file).
+            content = b''
+            if key.size:
+                headers = {'Range': 'bytes=0-{0}'.format(self.sniff_size - 1)}
+
+                # Use a new key object for each request, as they may be made
+                # concurrently (hedged).
+                def read():
+                    return key.bucket.new_key(key.name).get_contents_as_string(
+                        headers=headers)
+
+                content = resilience.call(read, hedged=True)
+
+            # Determine the content type of gzip compressed uploads from the
+            # decompressed content (which may be truncated). If even the start
+            # decompresses to more than the maximum size, so would the file.
+            if key.content_encoding == 'gzip':
+                try:
+                    content = self.decompress(content)
+                except zlib.error:
+                    pass
+
+            self._upload_content_type = get_magic().from_buffer(content)
         return self._upload_content_type
 
     def get_upload_key(self):
@@ -367,10 +871,29 @@ class ValidateS3UploadForm(ContentTypePrefixMixin, KeyPrefixMixin,
         """
 
         if not hasattr(self, '_upload_key'):
-            self._upload_key = self.get_storage().bucket.get_key(
-                self.cleaned_data['key_name'])
+            headers = None
+            if self.get_require_checksum():
+                from .checksums import get_checksum_bucket
+                bucket = get_checksum_bucket(self.get_storage())
+                headers = {'x-amz-checksum-mode': 'ENABLED'}
+            else:
+                bucket = self.get_storage().bucket
+            self._upload_key = resilience.call(
+                lambda: bucket.get_key(self.cleaned_data['key_name'],
+                                       headers=headers),
+                hedged=True)
         return self._upload_key
 
+    def get_upload_checksum(self):
+        """Return the SHA-256 checksum of the upload, verified by S3.
+
+        :returns: Base64 encoded checksum, or ``None`` if not available.
+        :rtype: :py:class:`unicode`
+
+        """
+
+        return getattr(self.get_upload_key(), 'checksum_sha256', None)
+
     def get_upload_key_metadata(self):
         """Generate metadata dictionary from a bucket key."""
         key = self.get_upload_key()
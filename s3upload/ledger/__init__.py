@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""An optional ledger of uploads, stored in the database.
+
+Add ``'s3upload.ledger'`` to ``INSTALLED_APPS``, and use
+:py:class:`s3upload.ledger.views.UploadLedgerMixin` with the upload views, to
+record each presigned upload, validation outcome and processed file. Pending
+(presigned but never validated), failed and processed uploads can then be found
+with (indexed) database queries, rather than listing keys in the S3 bucket.
+
+"""
+
+
+default_app_config = 's3upload.ledger.apps.LedgerConfig'
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from .models import Upload
+from django.contrib import admin
+
+
+@admin.register(Upload)
+class UploadAdmin(admin.ModelAdmin):
+
+    date_hierarchy = 'created'
+
+    list_display = ['key_name', 'status', 'owner', 'size', 'content_type',
+                    'created']
+
+    list_filter = ['status', 'created']
+
+    list_select_related = ['owner']
+
+    raw_id_fields = ['owner']
+
+    search_fields = ['key_name', 'processed_key_name']
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 13:07
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('signed', 'Signed'), ('invalid', 'Invalid'), ('failed', 'Failed'), ('processed', 'Processed')], max_length=16)),
+                ('bucket_name', models.CharField(max_length=63)),
+                ('key_name', models.CharField(db_index=True, max_length=1024)),
+                ('etag', models.CharField(blank=True, max_length=64)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('content_type', models.CharField(blank=True, max_length=255)),
+                ('processed_key_name', models.CharField(blank=True, max_length=1024)),
+                ('errors', models.TextField(blank=True)),
+                ('expires', models.DateTimeField(blank=True, null=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='upload',
+            index_together=set([('owner', 'status', 'created'), ('status', 'created')]),
+        ),
+    ]
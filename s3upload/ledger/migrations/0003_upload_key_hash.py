@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from hashlib import sha1
+
+
+def set_key_hashes(apps, schema_editor):
+    """Set the key hash of each entry. Signed upload forms (whose key names
+    are templates) are removed, and only the latest entry for each upload is
+    kept, before the key hash is made unique."""
+    Upload = apps.get_model('s3upload_ledger', 'Upload')
+    Upload.objects.filter(status='signed',
+                          key_name__contains='${filename}').delete()
+    key_hashes = set()
+    duplicates = []
+    for upload in Upload.objects.order_by('-modified', '-pk').iterator():
+        key_hash = sha1('{0}/{1}'.format(
+            upload.bucket_name, upload.key_name).encode('utf-8')).hexdigest()
+        if key_hash in key_hashes:
+            duplicates.append(upload.pk)
+        else:
+            key_hashes.add(key_hash)
+            Upload.objects.filter(pk=upload.pk).update(key_hash=key_hash)
+    for index in range(0, len(duplicates), 500):
+        Upload.objects.filter(pk__in=duplicates[index:index + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('s3upload_ledger', '0002_upload_checksum_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='key_hash',
+            field=models.CharField(max_length=40, null=True),
+        ),
+        migrations.RunPython(set_key_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('s3upload_ledger', '0003_upload_key_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='upload',
+            name='key_hash',
+            field=models.CharField(max_length=40, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='upload',
+            name='key_name',
+            field=models.CharField(max_length=1024),
+        ),
+    ]
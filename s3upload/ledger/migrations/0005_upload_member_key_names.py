@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 13:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('s3upload_ledger', '0004_upload_key_hash_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='member_key_names',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from hashlib import sha1
+
+
+class UploadQuerySet(models.QuerySet):
+
+    def failed(self):
+        return self.filter(status__in=[Upload.STATUS_INVALID,
+                                       Upload.STATUS_FAILED])
+
+    def pending(self, before=None):
+        """Signed (presigned) uploads which have not been validated,
+        optionally those which expired before the given datetime."""
+        queryset = self.filter(status=Upload.STATUS_SIGNED)
+        if before is not None:
+            queryset = queryset.filter(expires__lt=before)
+        return queryset
+
+    def processed(self):
+        return self.filter(status=Upload.STATUS_PROCESSED)
+
+    def update_status(self, status, **kwargs):
+        """Update the status of all uploads in the queryset, in a single
+        query."""
+        kwargs.update({'status': status, 'modified': timezone.now()})
+        return self.update(**kwargs)
+
+
+@python_2_unicode_compatible
+class Upload(models.Model):
+    """An entry in the upload ledger."""
+
+    STATUS_SIGNED = 'signed'
+    STATUS_INVALID = 'invalid'
+    STATUS_FAILED = 'failed'
+    STATUS_PROCESSED = 'processed'
+    STATUS_CHOICES = (
+        (STATUS_SIGNED, 'Signed'),
+        (STATUS_INVALID, 'Invalid'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_PROCESSED, 'Processed'),
+    )
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES)
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True,
+                              on_delete=models.SET_NULL, related_name='+')
+
+    bucket_name = models.CharField(max_length=63)
+
+    key_name = models.CharField(max_length=1024)
+    """Key name of the upload."""
+
+    key_hash = models.CharField(max_length=40, unique=True)
+    """SHA-1 digest of the bucket and key names, identifying the upload (the
+    key name is too long to index on some databases)."""
+
+    etag = models.CharField(max_length=64, blank=True)
+
+    size = models.BigIntegerField(blank=True, null=True)
+
+    content_type = models.CharField(max_length=255, blank=True)
+
+    checksum_sha256 = models.CharField(max_length=44, blank=True)
+    """Base64 encoded SHA-256 checksum of the upload, verified by S3."""
+
+    processed_key_name = models.CharField(max_length=1024, blank=True)
+
+    member_key_names = models.TextField(blank=True)
+    """Key names of the processed files expanded from an archive upload, one
+    per line (the processed key name is then blank)."""
+
+    errors = models.TextField(blank=True)
+
+    expires = models.DateTimeField(blank=True, null=True)
+    """Expiration time of the policy, for a signed form."""
+
+    created = models.DateTimeField(default=timezone.now)
+
+    modified = models.DateTimeField(default=timezone.now)
+
+    objects = UploadQuerySet.as_manager()
+
+    class Meta(object):
+        index_together = [('status', 'created'),
+                          ('owner', 'status', 'created')]
+        ordering = ['-created']
+
+    def __str__(self):
+        return self.key_name
+
+    @staticmethod
+    def get_key_hash(bucket_name, key_name):
+        """Return the key hash for a bucket and key name."""
+        return sha1('{0}/{1}'.format(bucket_name, key_name).encode(
+            'utf-8')).hexdigest()
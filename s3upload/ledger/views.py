@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from .writer import UploadLedger
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class UploadLedgerMixin(object):
+    """Records presigned uploads, validation outcomes and processed files in
+    the upload ledger, for use with :py:class:`s3upload.views.S3UploadFormView`
+    (and subclasses).
+
+    Entries are buffered during each request, and saved in bulk at the end.
+    If they cannot be saved, the error is logged rather than failing the
+    request.
+
+    """
+
+    ledger_class = UploadLedger
+
+    def dispatch(self, request, *args, **kwargs):
+        self.ledger = self.ledger_class()
+        try:
+            return super(UploadLedgerMixin, self).dispatch(
+                request, *args, **kwargs)
+        finally:
+            self.flush_ledger()
+
+    def flush_ledger(self):
+        """Save the buffered ledger entries, logging any error."""
+        try:
+            self.ledger.flush()
+        except Exception:
+            logger.exception('Could not save upload ledger entries.')
+
+    def form_invalid(self, form):
+        self.ledger.record_invalid(form, owner=self.get_ledger_owner())
+        return super(UploadLedgerMixin, self).form_invalid(form)
+
+    def form_valid(self, form, *args, **kwargs):
+        try:
+            response = super(UploadLedgerMixin, self).form_valid(
+                form, *args, **kwargs)
+        except Exception as error:
+            self.ledger.record_failed(form, owner=self.get_ledger_owner(),
+                                      errors=repr(error))
+            raise
+        self.ledger.record_processed(form, owner=self.get_ledger_owner())
+        return response
+
+    def get_form(self, *args, **kwargs):
+        form = super(UploadLedgerMixin, self).get_form(*args, **kwargs)
+        self.ledger.record_signed(form, owner=self.get_ledger_owner())
+        return form
+
+    def presign_valid(self, forms):
+        owner = self.get_ledger_owner()
+        for form in forms:
+            self.ledger.record_signed(form, owner=owner)
+        return super(UploadLedgerMixin, self).presign_valid(forms)
+
+    def get_ledger_owner(self):
+        """Return the user to record as the owner of ledger entries."""
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user
+        return None
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from .models import Upload
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+import calendar
+
+
+# Fields which are updated when an upload is recorded again (e.g. a signed
+# upload which has been processed, or a retry).
+UPDATE_FIELDS = ['status', 'etag', 'size', 'content_type', 'checksum_sha256',
+                 'processed_key_name', 'member_key_names', 'errors']
+
+
+class UploadLedger(object):
+    """Buffers writes to the upload ledger, and saves them in bulk.
+
+    Entries are identified by the bucket and key name of the upload (see
+    :py:attr:`s3upload.ledger.models.Upload.key_hash`). New entries are
+    inserted with a single ``bulk_create``. Uploads which already have an
+    entry (e.g. a presigned upload which has since been processed) are
+    updated in place instead, with one ``UPDATE`` query for each distinct set
+    of values. Processed entries are never updated, so that e.g. a repeated
+    request to validate the (since deleted) upload does not overwrite them.
+
+    """
+
+    def __init__(self):
+        self._uploads = OrderedDict()
+
+    def _add(self, upload):
+        upload.key_hash = Upload.get_key_hash(upload.bucket_name,
+                                              upload.key_name)
+        self._uploads[upload.key_hash] = upload
+        return upload
+
+    def _get_existing(self, key_hashes):
+        """Return the key hashes which already have an entry."""
+        return set(Upload.objects.filter(key_hash__in=key_hashes).values_list(
+            'key_hash', flat=True))
+
+    def _record_upload(self, form, status, owner=None, **kwargs):
+        # Only record keys which exist (under the key prefix), rather than any
+        # key name which is posted.
+        key_name = getattr(form, 'cleaned_data', {}).get('key_name')
+        if not key_name:
+            return None
+        # Use the key (object) from validation, if any, rather than making
+        # further requests to S3.
+        key = getattr(form, '_upload_key', None)
+        fields = {
+            'status': status,
+            'owner': owner,
+            'bucket_name': form.get_bucket_name(),
+            'key_name': key_name,
+            'etag': form.cleaned_data.get('etag') or '',
+        }
+        if key:
+            fields.update({
+                'size': key.size,
+                'content_type': getattr(form, '_upload_content_type', None) or
+                key.content_type or '',
+                'checksum_sha256': getattr(key, 'checksum_sha256', None) or '',
+            })
+        fields.update(kwargs)
+        return self._add(Upload(**fields))
+
+    def _save(self):
+        now = timezone.now()
+        existing = self._get_existing(list(self._uploads))
+
+        creates = []
+        updates = defaultdict(list)
+        for key_hash, upload in self._uploads.items():
+            if key_hash in existing:
+                values = tuple((name, getattr(upload, name))
+                               for name in UPDATE_FIELDS)
+                updates[values].append(key_hash)
+            else:
+                creates.append(upload)
+
+        with transaction.atomic():
+            if creates:
+                Upload.objects.bulk_create(creates)
+            for values, key_hashes in updates.items():
+                Upload.objects.filter(key_hash__in=key_hashes).exclude(
+                    status=Upload.STATUS_PROCESSED).update(
+                        modified=now, **dict(values))
+
+    def flush(self):
+        """Save all buffered entries to the database.
+
+        If an entry for the same upload is inserted concurrently (by another
+        request), the entries are saved again, updating it.
+
+        """
+
+        if self._uploads:
+            try:
+                self._save()
+            except IntegrityError:
+                self._save()
+        self._uploads = OrderedDict()
+    flush.alters_data = True
+
+    def record_failed(self, form, owner=None, errors=''):
+        """Record a valid upload which could not be processed."""
+        return self._record_upload(form, Upload.STATUS_FAILED, owner,
+                                   errors=errors)
+
+    def record_invalid(self, form, owner=None):
+        """Record an upload which did not validate.
+
+        Only uploads of keys which exist (under the key prefix) are recorded.
+
+        """
+
+        return self._record_upload(form, Upload.STATUS_INVALID, owner,
+                                   errors=form.errors.as_text())
+
+    def record_processed(self, form, owner=None):
+        """Record a processed upload.
+
+        An expanded archive has no processed key, so the keys of its members
+        (from the manifest) are recorded instead.
+
+        """
+
+        if form.get_expand_archives():
+            return self._record_upload(
+                form, Upload.STATUS_PROCESSED, owner,
+                member_key_names='\n'.join(
+                    entry['key'] for entry in getattr(form, 'manifest', [])
+                    if 'key' in entry))
+        return self._record_upload(
+            form, Upload.STATUS_PROCESSED, owner,
+            processed_key_name=form.get_processed_key_name())
+
+    def record_signed(self, form, owner=None):
+        """Record a signed (presigned) upload.
+
+        The key of an upload form is a template (``${filename}``), which S3
+        completes when the file is uploaded, so upload forms are not recorded
+        until the upload is validated.
+
+        """
+
+        key_name = form.get_key()
+        if '${filename}' in key_name:
+            return None
+        expires = datetime.fromtimestamp(
+            calendar.timegm(form.get_expiration_time()), timezone.utc)
+        if not settings.USE_TZ:
+            expires = timezone.make_naive(expires)
+        return self._add(Upload(
+            status=Upload.STATUS_SIGNED, owner=owner,
+            bucket_name=form.get_bucket_name(), key_name=key_name,
+            expires=expires))
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Retries and hedged requests for the S3 operations made by the forms.
+
+Transient errors (server errors, throttling and connection problems) can be
+retried with exponential backoff and full jitter, up to
+``S3UPLOAD_RETRY_ATTEMPTS`` attempts. Idempotent reads can also be hedged: if
+no response has been received after ``S3UPLOAD_HEDGE_DELAY`` seconds, a
+duplicate request is made, and whichever response arrives first is used.
+
+boto also retries server errors itself (up to the ``num_retries`` boto config
+option, 6 by default), so by default each call is only attempted once here.
+Retries at both levels multiply: to retry here instead, set ``num_retries`` to
+0 when increasing ``S3UPLOAD_RETRY_ATTEMPTS``. Note that boto 2 sleeps for up
+to a second after a server error, even when it is not going to retry the
+request.
+
+"""
+
+
+from __future__ import absolute_import, unicode_literals
+from .settings import settings
+from collections import Counter
+import random
+import socket
+import threading
+import time
+
+try:
+    from http.client import HTTPException
+    from queue import Empty, Queue
+except ImportError:
+    from httplib import HTTPException
+    from Queue import Empty, Queue
+
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class Counters(object):
+    """Thread-safe counters of calls, retries, failures and hedges."""
+
+    def __init__(self):
+        self._counter = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, name):
+        with self._lock:
+            self._counter[name] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counter.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counter)
+
+
+counters = Counters()
+
+
+def is_retryable(error):
+    """Return whether an error raised by an S3 operation is transient."""
+    if getattr(error, 'status', None) in RETRYABLE_STATUSES:
+        return True
+    return isinstance(error, (socket.error, HTTPException))
+
+
+def retry(function):
+    """Call a function, retrying transient errors with jittered backoff."""
+    attempts = settings.RETRY_ATTEMPTS
+    for attempt in range(attempts):
+        counters.increment('calls')
+        try:
+            return function()
+        except Exception as error:
+            if attempt + 1 >= attempts or not is_retryable(error):
+                counters.increment('failures')
+                raise
+            counters.increment('retries')
+            time.sleep(random.uniform(0, min(
+                settings.RETRY_BACKOFF_MAX,
+                settings.RETRY_BACKOFF * 2 ** attempt)))
+
+
+def hedge(function):
+    """Call a function, calling it again concurrently if it is slow.
+
+    Only use for idempotent reads. The first successful result is returned;
+    if both calls fail, the error from the last to fail is raised.
+
+    """
+
+    delay = settings.HEDGE_DELAY
+    if not delay:
+        return function()
+
+    results = Queue()
+
+    def run(index):
+        try:
+            results.put((index, True, function()))
+        except Exception as error:
+            results.put((index, False, error))
+
+    def start(index):
+        thread = threading.Thread(target=run, args=(index,))
+        thread.daemon = True
+        thread.start()
+
+    start(0)
+    try:
+        index, success, value = results.get(timeout=delay)
+    except Empty:
+        counters.increment('hedges')
+        start(1)
+        index, success, value = results.get()
+        if not success:
+            index, success, value = results.get()
+        if success and index == 1:
+            counters.increment('hedge_wins')
+
+    if not success:
+        raise value
+    return value
+
+
+def call(function, hedged=False):
+    """Call a function making an S3 request, with retries, and hedging if
+    ``hedged`` is true (for idempotent reads only)."""
+    if hedged:
+        return retry(lambda: hedge(function))
+    return retry(function)
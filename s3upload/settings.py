@@ -17,14 +17,70 @@
 
 from __future__ import absolute_import, unicode_literals
 from datetime import timedelta
-from django.conf import settings
+import sys
+import types
 
 
-CSRF_FAILURE_VIEW = settings.CSRF_FAILURE_VIEW
+DEFAULTS = {
+    'ARCHIVE_MAX_MEMBER_SIZE': 64 * 1024 * 1024,  # bytes
+    'ARCHIVE_MAX_MEMBERS': 10000,
+    'ARCHIVE_MAX_SIZE': 1024 * 1024 * 1024,  # bytes, uncompressed
+    'ARCHIVE_PUT_CONCURRENCY': 8,
+    'ARCHIVE_SPOOL_SIZE': 8 * 1024 * 1024,  # bytes
+    'DERIVATIVE_PROCESSES': 0,  # See s3upload.derivatives
+    'DERIVATIVE_QUEUE_DEPTH': 8,
+    'DERIVATIVE_QUEUE_TIMEOUT': 1.0,  # seconds
+    'DERIVATIVE_UPLOAD_THREADS': 4,
+    'EXPIRATION_RESOLUTION': None,
+    'EXPIRATION_TIMEDELTA': timedelta(minutes=30),
+    'HEDGE_DELAY': None,  # seconds
+    'MAX_DECOMPRESSED_SIZE': 64 * 1024 * 1024,  # bytes
+    'REDIRECT_TOKEN_MAX_AGE': timedelta(hours=1),
+    'RETRY_ATTEMPTS': 1,  # See s3upload.resilience
+    'RETRY_BACKOFF': 0.05,  # seconds
+    'RETRY_BACKOFF_MAX': 1.0,  # seconds
+    'SET_CONTENT_TYPE': True,
+    'SIGNED_URL_CACHE_SIZE': 10000,
+    'SIGNED_URL_MARGIN': timedelta(minutes=5),
+}
 
 
-EXPIRATION_TIMEDELTA = getattr(
-    settings, 'S3UPLOAD_EXPIRATION_TIMEDELTA', timedelta(minutes=30))
+class Settings(object):
+    """Settings for s3upload, read from the Django settings on access.
 
+    Reading is deferred so that importing s3upload does not require (or
+    trigger) configuration of the Django settings. Each setting can be
+    overridden by a Django setting of the same name, prefixed with
+    ``S3UPLOAD_``.
 
-SET_CONTENT_TYPE = getattr(settings, 'S3UPLOAD_SET_CONTENT_TYPE', True)
+    """
+
+    @property
+    def CSRF_FAILURE_VIEW(self):
+        from django.conf import settings
+        return settings.CSRF_FAILURE_VIEW
+
+    def __getattr__(self, name):
+        if name not in DEFAULTS:
+            raise AttributeError(name)
+        from django.conf import settings
+        return getattr(settings, 'S3UPLOAD_{0}'.format(name), DEFAULTS[name])
+
+
+class SettingsModule(types.ModuleType):
+    """This module, which also exposes each setting as a module attribute
+    (e.g. ``s3upload.settings.SET_CONTENT_TYPE``), read from the Django
+    settings on access."""
+
+    def __getattr__(self, name):
+        return getattr(self.settings, name)
+
+
+settings = Settings()
+
+
+# Replace this module with a SettingsModule, keeping a reference to the
+# original (Python 2 clears the globals of a module when it is deleted).
+_module = sys.modules[__name__]
+sys.modules[__name__] = SettingsModule(__name__, __doc__)
+sys.modules[__name__].__dict__.update(_module.__dict__)
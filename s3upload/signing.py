@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Signing (GET) urls for processed files in bulk.
+
+``S3BotoStorage.url`` signs each url separately, building the signing key
+and the bucket url each time, with a new expiration time.
+:py:class:`URLSigner` keeps the signing key and bucket url, signs a batch of
+files with the same expiration time, and caches each url until
+``S3UPLOAD_SIGNED_URL_MARGIN`` before it expires. Expiration times are rounded
+up to a multiple of the margin, so the url for a file is stable (and can be
+cached by browsers) for a while.
+
+In templates, ``{% load s3upload %}`` then use ``{% processed_url path %}``,
+or ``{% processed_urls paths as urls %}`` for a list of paths.
+
+"""
+
+
+from __future__ import absolute_import, unicode_literals
+from .settings import settings
+from django.core.files.storage import default_storage
+from hashlib import sha1
+import base64
+import hmac
+import math
+import threading
+import time
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+
+_signers_lock = threading.Lock()
+
+
+def get_signer(storage=None):
+    """Return a shared :py:class:`URLSigner` for the storage (by default,
+    the default storage).
+
+    The signer is kept on the storage, so it is released along with the
+    storage.
+
+    """
+
+    storage = storage if storage is not None else default_storage
+    signer = getattr(storage, '_s3upload_signer', None)
+    if signer is None:
+        with _signers_lock:
+            signer = getattr(storage, '_s3upload_signer', None)
+            if signer is None:
+                signer = URLSigner(storage)
+                storage._s3upload_signer = signer
+    return signer
+
+
+class URLSigner(object):
+    """Signs and caches GET urls for files (e.g. from
+    :py:meth:`s3upload.forms.ValidateS3UploadForm.get_processed_path`) in a
+    storage.
+
+    Urls expire after the storage's ``querystring_expire`` seconds (rounded
+    up). If the storage does not sign urls itself using (v2) query string
+    authentication, ``storage.url`` is used, and the result cached.
+
+    """
+
+    cache_size = None  # Defaults to S3UPLOAD_SIGNED_URL_CACHE_SIZE
+
+    margin = None  # Defaults to S3UPLOAD_SIGNED_URL_MARGIN
+
+    def __init__(self, storage=None, cache_size=None, margin=None):
+        self.storage = storage if storage is not None else default_storage
+        if cache_size is not None:
+            self.cache_size = cache_size
+        if margin is not None:
+            self.margin = margin
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _get_signing_material(self):
+        """Return the signing key (HMAC), url prefix and auth path prefix for
+        the bucket, or ``None`` if urls are not signed here."""
+        if not hasattr(self, '_signing_material'):
+            storage = self.storage
+            connection = storage.connection
+            if not storage.querystring_auth or storage.custom_domain or \
+                    connection.anon or connection.provider.security_token or \
+                    connection._auth_handler.capability[0] == 'hmac-v4-s3':
+                self._signing_material = None
+            else:
+                if storage.secure_urls:
+                    protocol, port = connection.protocol, connection.port
+                else:
+                    protocol, port = 'http', 80
+                calling_format = connection.calling_format
+                url_prefix = calling_format.build_url_base(
+                    connection, protocol, connection.server_name(port),
+                    storage.bucket_name)
+                auth_prefix = connection.get_path(
+                    calling_format.build_auth_path(storage.bucket_name))
+                digest = hmac.new(storage.secret_key.encode('utf-8'),
+                                  digestmod=sha1)
+                self._signing_material = (digest, url_prefix, auth_prefix)
+        return self._signing_material
+
+    def _sign(self, name, expires):
+        storage = self.storage
+        signing_material = self._get_signing_material()
+        if signing_material is None:
+            return storage.url(name, expire=expires - int(time.time()))
+
+        digest, url_prefix, auth_prefix = signing_material
+        key = quote(storage._encode_name(
+            storage._normalize_name(storage._clean_name(name))))
+        digest = digest.copy()
+        digest.update('GET\n\n\n{0}\n{1}{2}'.format(
+            expires, auth_prefix, key).encode('utf-8'))
+        signature = quote(base64.b64encode(digest.digest()), safe='')
+        return '{0}{1}?Signature={2}&Expires={3}&AWSAccessKeyId={4}'.format(
+            url_prefix, key, signature, expires, storage.access_key)
+
+    def get_cache_size(self):
+        if self.cache_size is not None:
+            return self.cache_size
+        return settings.SIGNED_URL_CACHE_SIZE
+
+    def get_expires(self, now=None):
+        """Return the expiration timestamp for urls signed now."""
+        margin = self.get_margin().total_seconds()
+        expires = (now or time.time()) + self.storage.querystring_expire
+        return int(math.ceil(expires / margin) * margin)
+
+    def get_margin(self):
+        if self.margin is not None:
+            return self.margin
+        return settings.SIGNED_URL_MARGIN
+
+    def sign(self, names):
+        """Return signed urls for the file names (paths in the storage).
+
+        :returns: List of urls, in the same order as the names.
+        :rtype: :py:class:`list`
+
+        """
+
+        now = time.time()
+        margin = self.get_margin().total_seconds()
+        with self._lock:
+            cached = [self._cache.get(name) for name in names]
+
+        # Sign without holding the lock, so that other threads can use the
+        # cache meanwhile.
+        expires = None
+        signed = {}
+        for name, entry in zip(names, cached):
+            if entry is None or entry[1] - margin <= now:
+                if expires is None:
+                    expires = self.get_expires(now)
+                signed[name] = (self._sign(name, expires), expires)
+
+        if signed:
+            cache_size = self.get_cache_size()
+            with self._lock:
+                if len(self._cache) + len(signed) > cache_size:
+                    self._cache.clear()
+                self._cache.update(list(signed.items())[:cache_size])
+
+        return [signed[name][0] if name in signed else entry[0]
+                for name, entry in zip(names, cached)]
+
+    def url(self, name):
+        """Return a signed url for the file name (path in the storage)."""
+        return self.sign([name])[0]
@@ -0,0 +1,19 @@
+// Compute the (base64 encoded) SHA-256 checksum of a file, off the main
+// thread, for S3 to verify the uploaded content against.
+self.onmessage = function (event) {
+    'use strict';
+
+    new Response(event.data).arrayBuffer().then(function (buffer) {
+        return crypto.subtle.digest('SHA-256', buffer);
+    }).then(function (digest) {
+        var bytes = new Uint8Array(digest),
+            binary = '',
+            i;
+        for (i = 0; i < bytes.length; i += 1) {
+            binary += String.fromCharCode(bytes[i]);
+        }
+        self.postMessage({checksum: btoa(binary)});
+    }, function (error) {
+        self.postMessage({error: String(error)});
+    });
+};
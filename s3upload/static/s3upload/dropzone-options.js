@@ -1,3 +1,7 @@
+// The checksum worker is served alongside this script.
+var checksumWorkerUrl = document.currentScript ? document.currentScript.src.replace(/dropzone-options\.js(\?.*)?$/, 'checksum-worker.js') : null;
+
+
 function pingServer(file) {
     // Ping our server with the data returned by the S3 repsonse
     'use strict';
@@ -37,6 +41,68 @@ function pingServer(file) {
 }
 
 
+function compressFile(file, contentTypes, minFileSize, done) {
+    // Gzip compress the file in the browser, if it is of a compressible
+    // content type, and the browser supports the Compression Streams API.
+    'use strict';
+
+    var compressible = contentTypes.some(function (prefix) {
+        return file.type.indexOf(prefix) === 0;
+    });
+
+    if (!compressible || typeof CompressionStream === 'undefined') {
+        done();
+        return;
+    }
+
+    new Response(file.stream().pipeThrough(new CompressionStream('gzip'))).blob().then(function (blob) {
+        // Only upload the compressed file if it is worthwhile
+        if (blob.size < file.size && blob.size >= minFileSize) {
+            file.compressed = blob;
+        }
+        done();
+    }, function () {
+        done();
+    });
+}
+
+
+function checksumFile(file, done) {
+    // Compute the SHA-256 checksum of the file to upload (compressed, if it has
+    // been) in a Web Worker, so that S3 can verify the uploaded content.
+    'use strict';
+
+    if (typeof Worker === 'undefined' || !checksumWorkerUrl) {
+        done('Checksums are not supported by this browser.');
+        return;
+    }
+
+    // Load the worker script from a blob, as static files may be served from
+    // another origin.
+    var worker = new Worker(URL.createObjectURL(new Blob(
+        ['importScripts(' + JSON.stringify(checksumWorkerUrl) + ');'],
+        {type: 'application/javascript'}
+    )));
+
+    worker.onmessage = function (event) {
+        worker.terminate();
+        if (event.data.checksum) {
+            file.checksum = event.data.checksum;
+            done();
+        } else {
+            done('Could not compute checksum: ' + event.data.error);
+        }
+    };
+
+    worker.onerror = function () {
+        worker.terminate();
+        done('Could not compute checksum.');
+    };
+
+    worker.postMessage(file.compressed || file);
+}
+
+
 Dropzone.options.s3upload = {
 
     //maxFilesize: 10,
@@ -45,8 +111,69 @@ Dropzone.options.s3upload = {
 
     parallelUploads: 5,
 
+    accept: function (file, done) {
+        // Reject files smaller than the minimum permitted by the upload policy
+        'use strict';
+        var minFileSize = this.element.getAttribute('data-min-file-size');
+        var compressContentTypes = this.element.getAttribute('data-compress-content-types');
+        if (this.element.getAttribute('data-checksum')) {
+            // Compute the checksum once the file has been accepted (and
+            // compressed, if it is to be).
+            done = (function (accepted) {
+                return function (error) {
+                    if (error) {
+                        accepted(error);
+                    } else {
+                        checksumFile(file, accepted);
+                    }
+                };
+            }(done));
+        }
+        if (minFileSize && file.size < parseInt(minFileSize, 10)) {
+            done('File is too small. Min filesize: ' + minFileSize + ' bytes.');
+        } else if (compressContentTypes) {
+            compressFile(file, compressContentTypes.split(' '), parseInt(minFileSize || '0', 10), done);
+        } else {
+            done();
+        }
+    },
+
     init: function () {
         'use strict';
+
+        // Mirror the maximum file size permitted by the upload policy
+        var maxFileSize = this.element.getAttribute('data-max-file-size');
+        if (maxFileSize) {
+            this.options.maxFilesize = parseInt(maxFileSize, 10) / 1024 / 1024;
+        }
+
+        var compress = this.element.getAttribute('data-compress-content-types'),
+            checksum = this.element.getAttribute('data-checksum');
+        if (compress || checksum) {
+            this.on('sending', function (file, xhr, formData) {
+                // Fields after the file are ignored by S3, so the
+                // Content-Encoding and checksum are added first, and the
+                // compressed file (if any) is swapped in for the original when
+                // it is appended.
+                var append = formData.append;
+                if (compress) {
+                    formData.append('Content-Encoding', file.compressed ? 'gzip' : 'identity');
+                }
+                if (checksum) {
+                    formData.append('x-amz-checksum-algorithm', 'SHA256');
+                    formData.append('x-amz-checksum-sha256', file.checksum);
+                }
+                formData.append = function () {
+                    var args = Array.prototype.slice.call(arguments);
+                    if (file.compressed && args[1] === file) {
+                        args[1] = file.compressed;
+                        args[2] = file.name;
+                    }
+                    return append.apply(formData, args);
+                };
+            });
+        }
+
         this.on('success', function (file) {
             pingServer(file);
         });
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Template tags for signed urls of processed files (see
+:py:mod:`s3upload.signing`)."""
+
+
+from __future__ import absolute_import, unicode_literals
+from ..signing import get_signer
+from django import template
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def processed_url(path, storage=None):
+    """Return a signed url for a processed file path.
+
+    ``{% processed_url path %}``
+
+    """
+
+    return get_signer(storage).url(path)
+
+
+@register.simple_tag
+def processed_urls(paths, storage=None):
+    """Return signed urls for a list of processed file paths, in one batch.
+
+    ``{% processed_urls paths as urls %}``
+
+    """
+
+    return get_signer(storage).sign(paths)
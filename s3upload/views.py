@@ -16,16 +16,22 @@
 
 
 from __future__ import absolute_import, unicode_literals
-from . import settings
-from .forms import DropzoneS3UploadForm, S3UploadForm, ValidateS3UploadForm
+from .forms import (ChecksumMixin, DropzoneS3UploadForm, PresignS3UploadForm,
+                    S3UploadForm, ValidateS3UploadForm)
+from .settings import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.core.files.storage import default_storage
 from django.core.urlresolvers import get_callable
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.middleware.csrf import REASON_BAD_TOKEN, REASON_NO_CSRF_COOKIE
-from django.utils.crypto import constant_time_compare
+from django.utils.crypto import constant_time_compare, salted_hmac
 from django.utils.decorators import method_decorator
 from django.views import generic
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
+import json
+import math
+import os
+import time
 
 try:
     from urllib import parse as urlparse
@@ -35,18 +41,51 @@ except ImportError:
     import urlparse
 
 
+REASON_BAD_REDIRECT_TOKEN = 'Redirect token missing, invalid or expired.'
+
+
 class S3UploadFormView(generic.edit.FormMixin,
                        generic.base.TemplateResponseMixin, generic.View):
 
+    compress_content_types = None  # e.g. ['text/', 'application/json']
+
     content_type_prefix = ''  # e.g. 'image/', 'text/'
 
+    derivatives = None  # e.g. {'thumbnail': 'myapp.renderers.thumbnail'}
+
+    expand_archives = False
+    """Expand uploaded zip and tar archives into a processed file for each
+    member. The content type prefix then applies to the members."""
+
+    expiration_resolution = None  # e.g. timedelta(minutes=5)
+
     form_class = S3UploadForm
 
+    max_file_size = None  # bytes, e.g. 10 * 1024 * 1024
+
+    min_file_size = None  # bytes
+
+    presign_batch_size = 100
+    """Maximum number of files in a single request for presigned uploads."""
+
+    presign_upload_form_class = PresignS3UploadForm
+
+    presigned_put = False
+    """Whether clients may request presigned PUT uploads, by POSTing JSON."""
+
     process_to = None  # e.g. 'foo/bar/'
 
     processed_key_generator = None
 
-    set_content_type = settings.SET_CONTENT_TYPE
+    redirect_authentication = 'csrf'  # or 'token'
+
+    redirect_token_salt = 's3upload.views.S3UploadFormView.redirect_token'
+
+    require_checksum = False
+    """Require a SHA-256 checksum of each upload, verified by S3 (only if
+    the form can send it, e.g. for Dropzone uploads)."""
+
+    set_content_type = None  # Defaults to S3UPLOAD_SET_CONTENT_TYPE
 
     storage = default_storage
 
@@ -59,20 +98,51 @@ class S3UploadFormView(generic.edit.FormMixin,
     def form_invalid(self, form):
         return HttpResponseBadRequest('Upload does not validate.')
 
+    def archive_invalid(self, form):
+        return HttpResponseBadRequest('Archive does not validate.')
+
     def form_valid(self, form, *args, **kwargs):
-        form.process_upload(set_content_type=self.set_content_type)
-        if self.request.is_ajax():
+        result = form.process_upload(
+            set_content_type=self.get_set_content_type())
+        if form.get_derivatives() and not self.get_expand_archives():
+            form.process_derivatives(result)
+        if self.request.is_ajax() and self.get_expand_archives():
+            return JsonResponse({'manifest': result})
+        elif self.request.is_ajax():
             return HttpResponse()
         else:
             return super(S3UploadFormView, self).form_valid(form, *args,
                                                             **kwargs)
 
-    @method_decorator(ensure_csrf_cookie)
+    def presign_invalid(self, forms):
+        return JsonResponse({'errors': [form.errors for form in forms]},
+                            status=400)
+
+    def presign_valid(self, forms):
+        return JsonResponse({'uploads': [form.get_upload() for form in forms]})
+
     def get(self, request, *args, **kwargs):
+        # The csrf cookie is not needed when using token authentication for
+        # the redirect, and is not set so that the upload page can be cached.
+        if self.get_redirect_authentication() == 'token':
+            return self._get(request, *args, **kwargs)
+        return ensure_csrf_cookie(self._get)(request, *args, **kwargs)
+
+    def _get(self, request, *args, **kwargs):
 
         # If 'key' is in GET params, we're dealing with a new upload
-        # (S3 redirect) - we should treat this like a POST and validate csrf.
-        if 'key' in request.GET:
+        # (S3 redirect) - we should treat this like a POST and validate the
+        # redirect token, or csrf.
+        if 'key' in request.GET and \
+                self.get_redirect_authentication() == 'token':
+
+            if not self.check_redirect_token(request.GET.get('token', '')):
+                failure_view = get_callable(settings.CSRF_FAILURE_VIEW)
+                return failure_view(request, REASON_BAD_REDIRECT_TOKEN)
+
+            return self.validate_upload()
+
+        elif 'key' in request.GET:
 
             csrf_token = request.META.get('CSRF_COOKIE', None)
             request_csrf_token = request.GET.get('csrfmiddlewaretoken', '')
@@ -89,9 +159,66 @@ class S3UploadFormView(generic.edit.FormMixin,
         form = self.get_form(form_class)
         return self.render_to_response(self.get_context_data(form=form))
 
+    def check_redirect_token(self, token):
+        """Return whether a redirect token is valid, and has not expired."""
+        expires, _, signature = token.partition(':')
+        try:
+            expired = int(expires) < time.time()
+        except ValueError:
+            return False
+        return not expired and constant_time_compare(
+            signature, self.get_redirect_token(int(expires)).partition(':')[2])
+
+    def get_compress_content_types(self):
+        return self.compress_content_types
+
     def get_content_type_prefix(self):
         return self.content_type_prefix
 
+    def get_context_data(self, **kwargs):
+        context = super(S3UploadFormView, self).get_context_data(**kwargs)
+        if self.get_redirect_authentication() == 'token':
+            # Rendering the csrf token would set (and vary on) the cookie
+            context.setdefault('csrf_token', '')
+        return context
+
+    def get_derivatives(self):
+        return self.derivatives
+
+    def get_expand_archives(self):
+        return self.expand_archives
+
+    def get_expiration_resolution(self):
+        if self.expiration_resolution is not None:
+            return self.expiration_resolution
+        return settings.EXPIRATION_RESOLUTION
+
+    def get_key_prefix(self):
+        """Return the key prefix used by the upload form."""
+        upload_to = self.get_upload_to()
+        if upload_to is None:
+            upload_to = self.get_form_class().upload_to
+        return os.path.join(self.get_storage().location, upload_to)
+
+    def get_max_file_size(self):
+        return self.max_file_size
+
+    def get_min_file_size(self):
+        return self.min_file_size
+
+    def get_upload_content_type_prefix(self):
+        """Return the content type prefix for the upload (form).
+
+        When expanding archives, the content type prefix applies to the
+        members, so any content type may be uploaded, and the archive is
+        checked by its content when validating.
+
+        """
+
+        if self.get_expand_archives():
+            return ''
+        return self.get_content_type_prefix()
+
     def get_upload_to(self):
         return self.upload_to
 
@@ -101,16 +228,97 @@ class S3UploadFormView(generic.edit.FormMixin,
         form_kwargs.update(
             {'storage': self.get_storage(),
              'upload_to': self.get_upload_to(),
-             'content_type_prefix': self.get_content_type_prefix(),
+             'content_type_prefix': self.get_upload_content_type_prefix(),
+             'min_file_size': self.get_min_file_size(),
+             'max_file_size': self.get_max_file_size(),
+             'expiration_resolution': self.get_expiration_resolution(),
              'success_action_redirect': self.get_success_action_redirect()})
+        if self.get_require_checksum():
+            form_kwargs.update({'require_checksum': True})
         return form_kwargs
 
+    def get_presign_batch_size(self):
+        return self.presign_batch_size
+
+    def get_presign_upload_form_class(self):
+        """Return the class of the form to use to presign an upload."""
+        return self.presign_upload_form_class
+
+    def get_presign_upload_form_kwargs(self):
+        """Return the keyword arguments (other than ``data``) for
+        instantiating the forms for presigning uploads."""
+        return {
+            'storage': self.get_storage(),
+            'upload_to': self.get_upload_to(),
+            'content_type_prefix': self.get_upload_content_type_prefix(),
+            'min_file_size': self.get_min_file_size(),
+            'max_file_size': self.get_max_file_size(),
+            'expiration_resolution': self.get_expiration_resolution(),
+            'require_checksum': self.get_require_checksum(),
+        }
+
+    def get_presign_upload_forms(self, files):
+        """Return an instance of the form to use to presign each upload."""
+        form_class = self.get_presign_upload_form_class()
+        form_kwargs = self.get_presign_upload_form_kwargs()
+        return [form_class(data=data, **form_kwargs) for data in files]
+
+    def get_presigned_put(self):
+        return self.presigned_put
+
     def get_process_to(self):
         return self.process_to
 
     def get_processed_key_generator(self):
         return self.processed_key_generator
 
+    def get_redirect_authentication(self):
+        """Return how to authenticate the redirect from S3 after an upload.
+
+        Either ``'csrf'`` to pass through the user's csrf token, or ``'token'``
+        to use a signed, expiring token scoped to the key prefix. A token is
+        not specific to the user, so the upload form can be cached. Tokens
+        are not supported by :py:class:`DropzoneS3UploadFormView`.
+
+        """
+
+        return self.redirect_authentication
+
+    def get_redirect_token(self, expires=None):
+        """Return a redirect token for the key prefix, expiring at the given
+        timestamp.
+
+        By default the token expires after ``S3UPLOAD_REDIRECT_TOKEN_MAX_AGE``
+        (rounded up to the expiration resolution, if any).
+
+        """
+
+        if expires is None:
+            expires = time.time() + \
+                settings.REDIRECT_TOKEN_MAX_AGE.total_seconds()
+            resolution = self.get_expiration_resolution()
+            if resolution:
+                seconds = resolution.total_seconds()
+                expires = math.ceil(expires / seconds) * seconds
+            expires = int(expires)
+        value = '{0}:{1}'.format(self.get_key_prefix(), expires)
+        signature = salted_hmac(self.redirect_token_salt, value).hexdigest()
+        return '{0}:{1}'.format(expires, signature)
+
+    def get_require_checksum(self):
+        # Otherwise every upload using the form would fail validation
+        if self.require_checksum and \
+                not issubclass(self.get_form_class(), ChecksumMixin):
+            raise ImproperlyConfigured(
+                'The form class of {0} does not send checksums, so they '
+                'cannot be required.'.format(self.__class__.__name__))
+        return self.require_checksum
+
+    def get_set_content_type(self):
+        if self.set_content_type is not None:
+            return self.set_content_type
+        return settings.SET_CONTENT_TYPE
+
     def get_storage(self):
         return self.storage
 
@@ -118,6 +326,12 @@ class S3UploadFormView(generic.edit.FormMixin,
         base_uri = self.request.build_absolute_uri()
         parts = list(urlparse.urlsplit(base_uri))
 
+        if self.get_redirect_authentication() == 'token':
+            query = urlparse.parse_qs(parts[3])  # Parse querystring
+            query.update({'token': self.get_redirect_token()})  # Add token
+            parts[3] = urlencode(query, doseq=True)  # Replace querystring
+            return urlparse.urlunsplit(parts)
+
         csrf_token = self.request.META.get('CSRF_COOKIE', None)
         if csrf_token:
             query = urlparse.parse_qs(parts[3])  # Parse querystring
@@ -128,6 +342,8 @@ class S3UploadFormView(generic.edit.FormMixin,
 
     @method_decorator(csrf_protect)
     def post(self, *args, **kwargs):
+        if self.request.content_type == 'application/json':
+            return self.presign_uploads()
         return self.validate_upload()
 
     def _get_bucket_name(self):
@@ -155,8 +371,14 @@ class S3UploadFormView(generic.edit.FormMixin,
             'storage': self.get_storage(),
             'upload_to': self.get_upload_to(),
             'content_type_prefix': self.get_content_type_prefix(),
+            'min_file_size': self.get_min_file_size(),
+            'max_file_size': self.get_max_file_size(),
+            'compress_content_types': self.get_compress_content_types(),
+            'require_checksum': self.get_require_checksum(),
             'process_to': self.get_process_to(),
             'processed_key_generator': self.get_processed_key_generator(),
+            'derivatives': self.get_derivatives(),
+            'expand_archives': self.get_expand_archives(),
         }
 
         # ``data`` may be provided by a POST from the JavaScript if using a
@@ -175,11 +397,46 @@ class S3UploadFormView(generic.edit.FormMixin,
         form_kwargs = self.get_validate_upload_form_kwargs()
         return self.validate_upload_form_class(**form_kwargs)
 
+    def presign_uploads(self):
+        """Presign a batch of PUT uploads.
+
+        The request body is a JSON object, with a list of ``files``, each
+        with a ``content_type``, ``size`` and (optionally) ``filename``.
+        Responds with a list of ``uploads`` in the same order (see
+        :py:meth:`s3upload.forms.PresignS3UploadForm.get_upload`), or of
+        ``errors`` if any of the files do not validate.
+
+        """
+
+        if not self.get_presigned_put():
+            return HttpResponseBadRequest('Presigned uploads are not enabled.')
+
+        try:
+            files = json.loads(self.request.body.decode('utf-8'))['files']
+        except (KeyError, TypeError, ValueError):
+            return HttpResponseBadRequest('Invalid request.')
+        if not isinstance(files, list) or \
+                not all(isinstance(data, dict) for data in files) or \
+                not 0 < len(files) <= self.get_presign_batch_size():
+            return HttpResponseBadRequest('Invalid request.')
+
+        forms = self.get_presign_upload_forms(files)
+        if all([form.is_valid() for form in forms]):
+            return self.presign_valid(forms)
+        else:
+            return self.presign_invalid(forms)
+
     def validate_upload(self):
         # Validate a new upload
+        from .archives import ArchiveError
         form = self.get_validate_upload_form()
         if form.is_valid():
-            return self.form_valid(form)
+            try:
+                return self.form_valid(form)
+            except ArchiveError:
+                return self.archive_invalid(form)
+            except ValidationError:
+                return self.form_invalid(form)
         else:
             return self.form_invalid(form)
 
@@ -190,5 +447,23 @@ class DropzoneS3UploadFormView(S3UploadFormView):
 
     template_name = 's3upload/dropzone_form.html'
 
+    def get_form_kwargs(self, *args, **kwargs):
+        form_kwargs = super(DropzoneS3UploadFormView, self).get_form_kwargs(
+            *args, **kwargs)
+        form_kwargs.update(
+            {'compress_content_types': self.get_compress_content_types()})
+        return form_kwargs
+
+    def get_redirect_authentication(self):
+        # Uploads are not redirected, and the csrf token is needed to POST
+        # (ping) each upload to the view.
+        redirect_authentication = super(
+            DropzoneS3UploadFormView, self).get_redirect_authentication()
+        if redirect_authentication == 'token':
+            raise ImproperlyConfigured(
+                'DropzoneS3UploadFormView does not support token redirect '
+                'authentication.')
+        return redirect_authentication
+
     def get_success_action_redirect(self):
         return None
@@ -16,7 +16,8 @@ setup(
     author='Matt Austin',
     author_email='mail@mattaustin.me.uk',
     url=__url__,
-    packages=['s3upload'],
+    packages=['s3upload', 's3upload.ledger', 's3upload.ledger.migrations',
+              's3upload.templatetags'],
     include_package_data=True,
     install_requires=['boto', 'django', 'django-storages', 'python-magic'],
     long_description=read('README.rst'),
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests, run against the in-memory S3 endpoint from :py:mod:`loadtest.fakes3`.
+
+Run with ``python -m unittest discover`` from a source checkout.
+
+"""
+
+
+from __future__ import absolute_import, unicode_literals
+from loadtest.fakes3 import FakeS3
+from loadtest.harness import BUCKET_NAME, configure, configure_boto
+import atexit
+
+
+# The fake S3 server thread is started once Django has started (and forked
+# the derivative render pool).
+fake_s3 = FakeS3()
+
+# Fail fast: the retries made by s3upload.resilience are tested separately.
+configure_boto(num_retries=0)
+
+configure(
+    fake_s3,
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+                           'NAME': ':memory:'}},
+    INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes',
+                    'django.contrib.staticfiles', 's3upload',
+                    's3upload.ledger'],
+    # Errors which are logged (rather than raised) are expected.
+    LOGGING={'version': 1,
+             'handlers': {'null': {'class': 'logging.NullHandler'}},
+             'loggers': {'s3upload': {'handlers': ['null'],
+                                      'propagate': False}}},
+    S3UPLOAD_DERIVATIVE_PROCESSES=2,
+    S3UPLOAD_RETRY_BACKOFF=0,
+    USE_TZ=True,
+)
+
+
+from django.core.management import call_command  # noqa: E402
+from django.test import RequestFactory, TestCase  # noqa: E402
+
+fake_s3.start()
+atexit.register(fake_s3.stop)
+
+call_command('migrate', verbosity=0)
+
+
+class S3TestCase(TestCase):
+    """Test case with an empty fake S3 bucket, and helpers for uploading to
+    it and validating uploads."""
+
+    bucket_name = BUCKET_NAME
+
+    def setUp(self):
+        from django.core.files.storage import default_storage
+        fake_s3.reset()
+        self.fake_s3 = fake_s3
+        self.storage = default_storage
+        self.bucket = default_storage.bucket
+        self.factory = RequestFactory()
+
+    def get_key_names(self):
+        """Return the (sorted) names of all of the keys in the bucket."""
+        return sorted(key for bucket, key in fake_s3._objects
+                      if bucket == self.bucket_name)
+
+    def upload(self, content, key_name='incoming/upload.txt',
+               content_type='text/plain', headers=None):
+        """Upload a file as a client would, without counting the request."""
+        key = self.bucket.new_key(key_name)
+        headers = dict(headers or {}, **{'Content-Type': content_type})
+        key.set_contents_from_string(content, headers=headers)
+        fake_s3.reset_counts()
+        return key
+
+    def get_validate_form(self, key, **kwargs):
+        """Return a bound validate form for an uploaded key."""
+        from s3upload.forms import ValidateS3UploadForm
+        data = {'bucket_name': self.bucket_name, 'key_name': key.name,
+                'etag': key.etag}
+        kwargs.setdefault('storage', self.storage)
+        return ValidateS3UploadForm(data=data, **kwargs)
+
+    def post_ping(self, view, key, etag=None, **headers):
+        """POST an uploaded key to a view, as the Dropzone ``pingServer``
+        callback does."""
+        request = self.factory.post(
+            '/', {'bucket': self.bucket_name, 'key': key.name,
+                  'etag': etag or key.etag},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest', **headers)
+        request._dont_enforce_csrf_checks = True
+        return view(request)
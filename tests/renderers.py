@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Renderers for the derivative tests, which are importable by the render
+pool processes."""
+
+
+from __future__ import absolute_import, unicode_literals
+import os
+import time
+
+
+def fail(content, content_type):
+    raise ValueError('Renderer failed.')
+
+
+def get_pid(content, content_type):
+    return str(os.getpid()).encode('ascii'), 'text/plain'
+
+
+def reverse(content, content_type):
+    return content[::-1], 'text/plain'
+
+
+def wait_for_file(content, content_type):
+    """Keep rendering until the file named by the content exists."""
+    path = content.decode('utf-8')
+    deadline = time.time() + 5
+    while not os.path.exists(path) and time.time() < deadline:
+        time.sleep(0.01)
+    return b'rendered', 'text/plain'
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from . import S3TestCase
+from django.test import override_settings
+from s3upload import archives
+from s3upload.archives import ArchiveError, expand_archive
+from s3upload.ledger.models import Upload
+from s3upload.ledger.views import UploadLedgerMixin
+from s3upload.views import DropzoneS3UploadFormView
+import io
+import json
+import threading
+import time
+import warnings
+import zipfile
+
+
+class ArchiveLedgerView(UploadLedgerMixin, DropzoneS3UploadFormView):
+
+    expand_archives = True
+
+
+def create_zip(members):
+    content = io.BytesIO()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # Duplicate names
+        with zipfile.ZipFile(content, 'w') as archive:
+            for name, member_content in members:
+                archive.writestr(name, member_content)
+    return content.getvalue()
+
+
+class ArchiveTestCase(S3TestCase):
+
+    def upload_zip(self, members, key_name='incoming/upload.zip'):
+        key = self.upload(create_zip(members), key_name, 'application/zip')
+        return self.bucket.get_key(key.name)
+
+    def expand(self, key):
+        return expand_archive(key, 'application/zip', 'text/',
+                              lambda name: 'processed/' + name, 'private')
+
+    def test_expand(self):
+        manifest = self.expand(self.upload_zip([('a.txt', b'hello'),
+                                                ('b.txt', b'world')]))
+        self.assertEqual([entry['key'] for entry in manifest],
+                         ['processed/a.txt', 'processed/b.txt'])
+        self.assertEqual(self.bucket.get_key('processed/b.txt').
+                         get_contents_as_string(), b'world')
+
+    def test_put_concurrency(self):
+        # Members are uploaded from their own pool, not the (smaller)
+        # derivative upload pool.
+        lock = threading.Lock()
+        active = [0]
+        max_active = [0]
+        put_member = archives.put_member
+
+        def slow_put_member(*args):
+            with lock:
+                active[0] += 1
+                max_active[0] = max(max_active[0], active[0])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            return put_member(*args)
+
+        key = self.upload_zip([('{0}.txt'.format(index), b'hello')
+                               for index in range(8)])
+        archives.put_member = slow_put_member
+        try:
+            self.expand(key)
+        finally:
+            archives.put_member = put_member
+        self.assertEqual(max_active[0], 8)
+        self.assertEqual(len(self.get_key_names()), 9)
+
+    def test_put_slots_are_shared(self):
+        # Members queued or being uploaded are limited across all archives,
+        # not for each archive.
+        lock = threading.Lock()
+        held = [0]
+        max_held = [0]
+        get_put_pool = archives.get_put_pool
+        pool = get_put_pool()
+        put_member = archives.put_member
+
+        class CountingPool(object):
+
+            def apply_async(self, function, args):
+                with lock:
+                    held[0] += 1
+                    max_held[0] = max(max_held[0], held[0])
+                return pool.apply_async(function, args)
+
+        def slow_put_member(*args):
+            time.sleep(0.05)
+            with lock:
+                held[0] -= 1
+            return put_member(*args)
+
+        keys = [self.upload_zip([('{0}/{1}.txt'.format(archive, index),
+                                  b'hello') for index in range(8)],
+                                'incoming/{0}.zip'.format(archive))
+                for archive in range(2)]
+        threads = [threading.Thread(target=self.expand, args=(key,))
+                   for key in keys]
+        archives.get_put_pool = CountingPool
+        archives.put_member = slow_put_member
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            archives.get_put_pool = get_put_pool
+            archives.put_member = put_member
+        self.assertLessEqual(max_held[0], 8)
+        self.assertEqual(len(self.get_key_names()), 2 + 16)
+
+    @override_settings(S3UPLOAD_ARCHIVE_MAX_MEMBERS=2)
+    def test_cleanup_error_keeps_original_error(self):
+        key = self.upload_zip([('a.txt', b'hello'), ('b.txt', b'hello'),
+                               ('c.txt', b'hello')])
+        self.fake_s3.fault_operations = ['delete_objects']
+        self.fake_s3.error_rate = 1
+        try:
+            with self.assertRaises(ArchiveError):
+                self.expand(key)
+        finally:
+            self.fake_s3.error_rate = 0
+            self.fake_s3.fault_operations = None
+        self.assertEqual(self.fake_s3.counts['delete_objects'], 1)
+
+    @override_settings(S3UPLOAD_ARCHIVE_MAX_MEMBERS=2)
+    def test_cleanup(self):
+        key = self.upload_zip([('a.txt', b'hello'), ('b.txt', b'hello'),
+                               ('c.txt', b'hello')])
+        with self.assertRaises(ArchiveError):
+            self.expand(key)
+        self.assertEqual(self.get_key_names(), ['incoming/upload.zip'])
+
+    def test_duplicate_names(self):
+        manifest = self.expand(self.upload_zip([
+            ('a.txt', b'first'), ('./a.txt', b'second'),
+            ('a.txt', b'third')]))
+        self.assertEqual(manifest[0]['key'], 'processed/a.txt')
+        self.assertEqual(manifest[1]['error'], 'Name is a duplicate.')
+        self.assertEqual(manifest[2]['error'], 'Name is a duplicate.')
+        self.assertEqual(self.bucket.get_key('processed/a.txt').
+                         get_contents_as_string(), b'first')
+
+    def test_ledger_records_member_keys(self):
+        view = ArchiveLedgerView.as_view(content_type_prefix='text/')
+        response = self.post_ping(
+            view, self.upload_zip([('a.txt', b'hello'), ('b.txt', b'world'),
+                                   ('c.bin', b'\x00\x01\x02\x03')]))
+        self.assertEqual(response.status_code, 200)
+        keys = [entry['key'] for entry in json.loads(
+            response.content.decode('utf-8'))['manifest'] if 'key' in entry]
+        self.assertEqual(len(keys), 2)
+        upload = Upload.objects.get()
+        self.assertEqual(upload.status, Upload.STATUS_PROCESSED)
+        self.assertEqual(upload.processed_key_name, '')
+        self.assertEqual(upload.member_key_names.split('\n'), keys)
+        self.assertEqual(self.get_key_names(), sorted(keys))
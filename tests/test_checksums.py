@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from . import S3TestCase
+from django.core.exceptions import ImproperlyConfigured
+from loadtest.fakes3 import get_checksum
+from s3upload.forms import DropzoneS3UploadForm, PresignS3UploadForm
+from s3upload.views import DropzoneS3UploadFormView, S3UploadFormView
+
+
+class ChecksumTestCase(S3TestCase):
+
+    def upload_checksummed(self, content):
+        return self.upload(content, headers={
+            'x-amz-checksum-sha256': get_checksum(content)})
+
+    def test_checksum(self):
+        form = self.get_validate_form(self.upload_checksummed(b'hello'),
+                                      require_checksum=True)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_upload_checksum(), get_checksum(b'hello'))
+        processed_key = form.process_upload()
+        # The checksum is kept with the processed file
+        processed_key = self.bucket.get_key(processed_key.name)
+        self.assertEqual(processed_key.get_metadata('sha256'),
+                         get_checksum(b'hello'))
+
+    def test_missing_checksum(self):
+        form = self.get_validate_form(self.upload(b'hello'),
+                                      require_checksum=True)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['__all__'],
+                         ['Checksum does not validate.'])
+
+    def test_checksum_not_required(self):
+        form = self.get_validate_form(self.upload(b'hello'))
+        self.assertTrue(form.is_valid())
+        self.assertIsNone(form.get_upload_checksum())
+
+    def test_s3_requests(self):
+        view = DropzoneS3UploadFormView.as_view(require_checksum=True)
+        response = self.post_ping(view, self.upload_checksummed(b'hello'))
+        self.assertEqual(response.status_code, 200)
+        # The checksum is returned with the HEAD, so no extra requests
+        self.assertEqual(dict(self.fake_s3.counts),
+                         {'head_object': 1, 'get_object': 1,
+                          'copy_object': 1, 'delete_object': 1})
+
+    def test_dropzone_form(self):
+        view = DropzoneS3UploadFormView.as_view(require_checksum=True)
+        response = view(self.factory.get('/'))
+        response.render()
+        self.assertIn(b' data-checksum="sha256"', response.content)
+
+    def test_form_without_checksums(self):
+        # S3UploadForm does not send checksums, so every upload would fail
+        view = S3UploadFormView.as_view(require_checksum=True)
+        with self.assertRaises(ImproperlyConfigured):
+            view(self.factory.get('/'))
+        with self.assertRaises(ImproperlyConfigured):
+            self.post_ping(view, self.upload_checksummed(b'hello'))
+
+    def test_dropzone_conditions(self):
+        form = DropzoneS3UploadForm(storage=self.storage,
+                                    require_checksum=True)
+        self.assertIn('{"x-amz-checksum-algorithm": "SHA256"}',
+                      form.get_conditions())
+        form = DropzoneS3UploadForm(storage=self.storage)
+        self.assertNotIn('{"x-amz-checksum-algorithm": "SHA256"}',
+                         form.get_conditions())
+
+
+class PresignChecksumTestCase(S3TestCase):
+
+    def get_form(self, **data):
+        data = dict({'content_type': 'text/plain', 'size': 5}, **data)
+        return PresignS3UploadForm(data=data, storage=self.storage,
+                                   require_checksum=True)
+
+    def test_checksum(self):
+        form = self.get_form(checksum_sha256=get_checksum(b'hello'))
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_headers()['x-amz-checksum-sha256'],
+                         get_checksum(b'hello'))
+
+    def test_missing_checksum(self):
+        form = self.get_form()
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['checksum_sha256'],
+                         ['Checksum is required.'])
+
+    def test_invalid_checksum(self):
+        for checksum in ['not base64!', 'aGVsbG8=']:
+            form = self.get_form(checksum_sha256=checksum)
+            self.assertFalse(form.is_valid())
+            self.assertEqual(form.errors['checksum_sha256'],
+                             ['Checksum does not validate.'])
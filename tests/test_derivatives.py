@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from . import S3TestCase
+from .renderers import fail, get_pid, reverse, wait_for_file
+from django.test import override_settings
+from s3upload import derivatives
+from s3upload.forms import ValidateS3UploadForm
+from s3upload.views import DropzoneS3UploadFormView
+import os
+import shutil
+import tempfile
+
+
+class RecordingValidateS3UploadForm(ValidateS3UploadForm):
+    """Records the (background) results of generating derivatives."""
+
+    results = []
+
+    def process_derivatives(self, *args, **kwargs):
+        result = super(RecordingValidateS3UploadForm,
+                       self).process_derivatives(*args, **kwargs)
+        self.results.append(result)
+        return result
+
+
+class DerivativeTestCase(S3TestCase):
+
+    def setUp(self):
+        super(DerivativeTestCase, self).setUp()
+        RecordingValidateS3UploadForm.results = []
+
+    def get_view(self, derivatives):
+        return DropzoneS3UploadFormView.as_view(
+            derivatives=derivatives,
+            validate_upload_form_class=RecordingValidateS3UploadForm)
+
+    def process_derivatives(self, content, derivatives):
+        form = self.get_validate_form(self.upload(content),
+                                      derivatives=derivatives)
+        self.assertTrue(form.is_valid())
+        processed_key = form.process_upload()
+        return form.process_derivatives(processed_key).get(5)
+
+    def test_process_derivatives(self):
+        keys = self.process_derivatives(b'hello', {'reversed': reverse})
+        self.assertEqual(list(keys), ['reversed'])
+        self.assertEqual(keys['reversed'].get_contents_as_string(), b'olleh')
+
+    def test_rendered_in_process_pool(self):
+        keys = self.process_derivatives(b'hello', {'pid': get_pid})
+        self.assertNotEqual(keys['pid'].get_contents_as_string(),
+                            str(os.getpid()).encode('ascii'))
+
+    def test_rendered_in_thread_without_process_pool(self):
+        # e.g. if the server process was forked after the pool was started
+        pid = derivatives._render_pool_pid
+        derivatives._render_pool_pid = None
+        try:
+            keys = self.process_derivatives(b'hello', {'pid': get_pid})
+        finally:
+            derivatives._render_pool_pid = pid
+        self.assertEqual(keys['pid'].get_contents_as_string(),
+                         str(os.getpid()).encode('ascii'))
+
+    def test_view_does_not_wait_for_derivatives(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'rendered')
+        view = self.get_view({'waited': wait_for_file})
+        response = self.post_ping(view, self.upload(path.encode('utf-8')))
+        self.assertEqual(response.status_code, 200)
+        # Still rendering, after the response
+        result, = RecordingValidateS3UploadForm.results
+        self.assertFalse(result.ready())
+        self.assertEqual(len(self.get_key_names()), 1)
+        open(path, 'w').close()
+        keys = result.get(5)
+        self.assertEqual(keys['waited'].get_contents_as_string(),
+                         b'rendered')
+        self.assertEqual(len(self.get_key_names()), 2)
+
+    def test_renderer_error_does_not_fail_upload(self):
+        view = self.get_view({'failed': fail, 'reversed': reverse})
+        response = self.post_ping(view, self.upload(b'hello'))
+        self.assertEqual(response.status_code, 200)
+        result, = RecordingValidateS3UploadForm.results
+        self.assertEqual(result.get(5), {})
+        # Only the processed file remains
+        key_names = self.get_key_names()
+        self.assertEqual(len(key_names), 1)
+        self.assertTrue(key_names[0].startswith('processed/'))
+
+    def test_upload_error_deletes_uploaded_derivatives(self):
+
+        def key_name_generator(name, content_type):
+            if name == 'failed':
+                raise ValueError('Upload failed.')
+            return 'derivatives/{0}'.format(name)
+
+        with self.assertRaises(ValueError):
+            derivatives.generate_derivatives(
+                self.bucket, b'hello', 'text/plain',
+                {'failed': reverse, 'reversed': reverse}, key_name_generator,
+                'private')
+        self.assertEqual(self.get_key_names(), [])
+
+    @override_settings(S3UPLOAD_DERIVATIVE_QUEUE_TIMEOUT=0.01)
+    def test_full_queue_is_shed(self):
+        form = self.get_validate_form(self.upload(b'hello'),
+                                      derivatives={'reversed': reverse})
+        self.assertTrue(form.is_valid())
+        processed_key = form.process_upload()
+        slots = derivatives.get_queue_slots()
+        acquired = 0
+        while slots.acquire(timeout=0):
+            acquired += 1
+        try:
+            self.assertIsNone(form.process_derivatives(processed_key))
+        finally:
+            for _ in range(acquired):
+                slots.release()
+        self.assertEqual(self.get_key_names(), [processed_key.name])
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from . import S3TestCase
+from django import forms
+from django.template.loader import render_to_string
+from django.test import override_settings
+from s3upload.forms import S3UploadForm
+from s3upload.views import DropzoneS3UploadFormView
+import gzip
+import io
+import uuid
+
+try:
+    from http.client import HTTPConnection
+    from urllib.parse import urlsplit
+except ImportError:
+    from httplib import HTTPConnection
+    from urlparse import urlsplit
+
+
+def compress(content):
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode='wb') as gzip_file:
+        gzip_file.write(content)
+    return compressed.getvalue()
+
+
+class ReplacedUploadView(DropzoneS3UploadFormView):
+    """Replaces the upload after it is validated, before it is processed."""
+
+    def form_valid(self, form, *args, **kwargs):
+        self.replace_upload(form.get_upload_key())
+        return super(ReplacedUploadView, self).form_valid(form, *args,
+                                                          **kwargs)
+
+    def replace_upload(self, key):
+        key.bucket.new_key(key.name).set_contents_from_string(
+            b'replaced', headers={'Content-Type': 'text/plain'})
+
+
+class ProcessUploadTestCase(S3TestCase):
+
+    def test_s3_requests(self):
+        view = DropzoneS3UploadFormView.as_view()
+        response = self.post_ping(view, self.upload(b'hello'))
+        self.assertEqual(response.status_code, 200)
+        # HEAD and GET (the start of) the upload, copy it, then delete it
+        self.assertEqual(dict(self.fake_s3.counts),
+                         {'head_object': 1, 'get_object': 1,
+                          'copy_object': 1, 'delete_object': 1})
+        self.assertEqual(len(self.get_key_names()), 1)
+
+    def test_replaced_upload_is_invalid(self):
+        form = self.get_validate_form(self.upload(b'hello'))
+        self.assertTrue(form.is_valid())
+        ReplacedUploadView().replace_upload(form.get_upload_key())
+        with self.assertRaises(forms.ValidationError):
+            form.process_upload()
+        self.assertEqual(form.errors['__all__'], ['Etag does not validate.'])
+        self.assertEqual(self.get_key_names(), ['incoming/upload.txt'])
+
+    def test_replaced_upload_view_is_invalid(self):
+        view = ReplacedUploadView.as_view()
+        response = self.post_ping(view, self.upload(b'hello'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_key_names(), ['incoming/upload.txt'])
+
+
+class CompressedUploadTestCase(S3TestCase):
+
+    def upload_compressed(self, content):
+        return self.upload(compress(content),
+                           headers={'Content-Encoding': 'gzip'})
+
+    def get_validate_form(self, key, **kwargs):
+        kwargs.setdefault('compress_content_types', ['text/'])
+        return super(CompressedUploadTestCase, self).get_validate_form(
+            key, **kwargs)
+
+    def test_compressed_upload(self):
+        form = self.get_validate_form(self.upload_compressed(b'hello'),
+                                      max_file_size=100 * 1024)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_upload_content_type(), 'text/plain')
+
+    def test_decompression_bomb(self):
+        # 20KB, which decompresses to 20MB
+        key = self.upload_compressed(b'\0' * 20 * 1024 * 1024)
+        self.assertLess(key.size, 100 * 1024)
+        form = self.get_validate_form(key, max_file_size=100 * 1024)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['__all__'],
+                         ['File size does not validate.'])
+
+    def test_decompression_bomb_view(self):
+        view = DropzoneS3UploadFormView.as_view(
+            compress_content_types=['text/'], max_file_size=100 * 1024)
+        key = self.upload_compressed(b'\0' * 20 * 1024 * 1024)
+        response = self.post_ping(view, key)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_key_names(), ['incoming/upload.txt'])
+
+    @override_settings(S3UPLOAD_MAX_DECOMPRESSED_SIZE=2 * 1024 * 1024)
+    def test_derivatives_decompression_bomb(self):
+        # The start of the upload decompresses to less than the maximum size,
+        # but the whole upload would not.
+        key = self.upload_compressed(b'a' * 4 * 1024 * 1024)
+        form = self.get_validate_form(
+            key, derivatives={'reversed': 'tests.renderers.reverse'})
+        self.assertTrue(form.is_valid())
+        processed_key = form.process_upload()
+        self.assertEqual(form.process_derivatives(processed_key).get(5),
+                         {})
+        self.assertEqual(self.get_key_names(), [processed_key.name])
+
+
+class FileSizeTestCase(S3TestCase):
+
+    def get_form(self, **kwargs):
+        return S3UploadForm(storage=self.storage, **kwargs)
+
+    def post(self, form, content):
+        """POST a file to S3 using the form, returning the status and body
+        of the response."""
+        boundary = uuid.uuid4().hex
+        lines = []
+        for name, field in form.fields.items():
+            if name != 'file':
+                lines += ['--' + boundary,
+                          'Content-Disposition: form-data; name="{0}"'.format(
+                              form.add_prefix(name)), '',
+                          '{0}'.format(field.initial)]
+        lines += ['--' + boundary,
+                  'Content-Disposition: form-data; name="file"; '
+                  'filename="upload.txt"', '', '']
+        body = '\r\n'.join(lines).encode('utf-8') + content + \
+            '\r\n--{0}--\r\n'.format(boundary).encode('utf-8')
+        action = urlsplit(form.get_action())
+        connection = HTTPConnection(action.netloc)
+        try:
+            connection.request(
+                str('POST'), str(action.path or '/'), body,
+                {str('Content-Type'): str(
+                    'multipart/form-data; boundary=' + boundary)})
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def test_post(self):
+        form = self.get_form(min_file_size=2, max_file_size=10)
+        status, body = self.post(form, b'hello')
+        self.assertEqual(status, 204)
+        self.assertEqual(self.get_key_names(), ['incoming/upload.txt'])
+
+    def test_post_too_small(self):
+        form = self.get_form(min_file_size=2, max_file_size=10)
+        status, body = self.post(form, b'h')
+        self.assertEqual(status, 400)
+        self.assertIn(b'EntityTooSmall', body)
+        self.assertEqual(self.get_key_names(), [])
+
+    def test_post_too_large(self):
+        form = self.get_form(min_file_size=2, max_file_size=10)
+        status, body = self.post(form, b'hello world')
+        self.assertEqual(status, 400)
+        self.assertIn(b'EntityTooLarge', body)
+        self.assertEqual(self.get_key_names(), [])
+
+    def test_conditions(self):
+        conditions = self.get_form(min_file_size=2,
+                                   max_file_size=10).get_conditions()
+        self.assertIn('["content-length-range", 2, 10]', conditions)
+        conditions = self.get_form(max_file_size=10).get_conditions()
+        self.assertIn('["content-length-range", 0, 10]', conditions)
+        conditions = self.get_form(min_file_size=2).get_conditions()
+        self.assertIn('["content-length-range", 2, {0}]'.format(
+            S3UploadForm.max_post_file_size), conditions)
+
+    def test_no_conditions(self):
+        for condition in self.get_form().get_conditions():
+            self.assertNotIn('content-length-range', condition)
+
+    def test_attributes(self):
+        html = render_to_string('s3upload/_form.html', {
+            'form': self.get_form(min_file_size=2, max_file_size=10)})
+        self.assertIn(' data-min-file-size="2"', html)
+        self.assertIn(' data-max-file-size="10"', html)
+        html = render_to_string('s3upload/_form.html',
+                                {'form': self.get_form()})
+        self.assertNotIn('data-min-file-size', html)
+        self.assertNotIn('data-max-file-size', html)
+
+    def test_validate(self):
+        for content, valid in [(b'h', False), (b'hello', True),
+                               (b'hello world', False)]:
+            form = self.get_validate_form(self.upload(content),
+                                          min_file_size=2, max_file_size=10)
+            self.assertEqual(form.is_valid(), valid)
+            if not valid:
+                self.assertEqual(form.errors['__all__'],
+                                 ['File size does not validate.'])
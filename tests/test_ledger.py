@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from . import S3TestCase
+from django.db import DatabaseError, IntegrityError
+from s3upload.ledger.models import Upload
+from s3upload.ledger.views import UploadLedgerMixin
+from s3upload.ledger.writer import UploadLedger
+from s3upload.views import DropzoneS3UploadFormView
+import json
+
+
+class LedgerView(UploadLedgerMixin, DropzoneS3UploadFormView):
+
+    presigned_put = True
+
+
+class StaleUploadLedger(UploadLedger):
+    """Does not see entries inserted by other requests, until retried."""
+
+    stale = True
+
+    def _get_existing(self, key_hashes):
+        if self.stale:
+            self.stale = False
+            return set()
+        return super(StaleUploadLedger, self)._get_existing(key_hashes)
+
+
+class BrokenUploadLedger(UploadLedger):
+
+    def flush(self):
+        raise DatabaseError('Database is unavailable.')
+
+
+class LedgerTestCase(S3TestCase):
+
+    def presign(self, view):
+        request = self.factory.post(
+            '/', json.dumps({'files': [{'content_type': 'text/plain',
+                                        'filename': 'hello.txt',
+                                        'size': 5}]}),
+            content_type='application/json')
+        request._dont_enforce_csrf_checks = True
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))['uploads'][0]
+
+    def test_presigned_upload_is_updated(self):
+        view = LedgerView.as_view()
+        upload = self.presign(view)
+        self.assertEqual(list(Upload.objects.pending().values_list(
+            'key_name', flat=True)), [upload['key']])
+
+        response = self.post_ping(view, self.upload(b'hello', upload['key']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Upload.objects.pending().count(), 0)
+        entry = Upload.objects.get()
+        self.assertEqual(entry.key_name, upload['key'])
+        self.assertEqual(entry.status, Upload.STATUS_PROCESSED)
+        self.assertEqual(entry.size, 5)
+        self.assertTrue(entry.processed_key_name.startswith('processed/'))
+        self.assertIsNotNone(entry.expires)
+
+    def test_upload_form_is_not_recorded(self):
+        request = self.factory.get('/')
+        response = LedgerView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Upload.objects.count(), 0)
+
+    def test_invalid_upload(self):
+        view = LedgerView.as_view()
+        response = self.post_ping(view, self.upload(b'hello'), etag='"0"')
+        self.assertEqual(response.status_code, 400)
+        entry = Upload.objects.get()
+        self.assertEqual(entry.status, Upload.STATUS_INVALID)
+        self.assertIn('Etag does not validate.', entry.errors)
+
+    def test_unknown_key_is_not_recorded(self):
+        view = LedgerView.as_view()
+        for key_name in ['incoming/unknown.txt', 'other/upload.txt']:
+            key = self.bucket.new_key(key_name)
+            key.etag = '"0"'
+            response = self.post_ping(view, key)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Upload.objects.count(), 0)
+
+    def test_replayed_ping(self):
+        view = LedgerView.as_view()
+        key = self.upload(b'hello')
+        self.assertEqual(self.post_ping(view, key).status_code, 200)
+        entry = Upload.objects.get()
+        # The upload has been deleted, so is no longer valid
+        self.assertEqual(self.post_ping(view, key).status_code, 400)
+        replayed_entry = Upload.objects.get()
+        self.assertEqual(replayed_entry.status, Upload.STATUS_PROCESSED)
+        self.assertEqual(replayed_entry.processed_key_name,
+                         entry.processed_key_name)
+        self.assertEqual(replayed_entry.errors, '')
+        self.assertEqual(replayed_entry.modified, entry.modified)
+
+    def test_processed_entry_is_not_updated(self):
+        view = LedgerView.as_view()
+        key = self.upload(b'hello')
+        self.assertEqual(self.post_ping(view, key).status_code, 200)
+        # An upload of the same key, which fails validation
+        key = self.upload(b'hello', key.name)
+        self.assertEqual(self.post_ping(view, key, etag='"0"').status_code,
+                         400)
+        self.assertEqual(Upload.objects.get().status,
+                         Upload.STATUS_PROCESSED)
+
+    def test_concurrent_insert(self):
+        view = LedgerView.as_view()
+        upload = self.presign(view)
+        response = self.post_ping(
+            LedgerView.as_view(ledger_class=StaleUploadLedger),
+            self.upload(b'hello', upload['key']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Upload.objects.get().status,
+                         Upload.STATUS_PROCESSED)
+
+    def test_key_hash_is_unique(self):
+        key_hash = Upload.get_key_hash(self.bucket_name, 'incoming/a.txt')
+        Upload.objects.create(status=Upload.STATUS_SIGNED,
+                              key_name='incoming/a.txt', key_hash=key_hash)
+        with self.assertRaises(IntegrityError):
+            Upload.objects.create(status=Upload.STATUS_PROCESSED,
+                                  key_name='incoming/a.txt',
+                                  key_hash=key_hash)
+
+    def test_ledger_error_does_not_fail_upload(self):
+        view = LedgerView.as_view(ledger_class=BrokenUploadLedger)
+        response = self.post_ping(view, self.upload(b'hello'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.get_key_names()), 1)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from . import S3TestCase
+from s3upload.views import DropzoneS3UploadFormView
+import json
+
+try:
+    from http.client import HTTPConnection
+    from urllib.parse import urlsplit
+except ImportError:
+    from httplib import HTTPConnection
+    from urlparse import urlsplit
+
+
+class PresignTestCase(S3TestCase):
+
+    view_kwargs = {'presigned_put': True, 'max_file_size': 1024}
+
+    def get_file(self, content, **kwargs):
+        return dict({'content_type': 'text/plain', 'size': len(content),
+                     'filename': 'upload.txt'}, **kwargs)
+
+    def post_files(self, files, **view_kwargs):
+        """POST files to presign, as a client would."""
+        view = DropzoneS3UploadFormView.as_view(
+            **dict(self.view_kwargs, **view_kwargs))
+        request = self.factory.post('/', json.dumps({'files': files}),
+                                    content_type='application/json')
+        request._dont_enforce_csrf_checks = True
+        response = view(request)
+        if response['Content-Type'] != 'application/json':
+            return response, None
+        return response, json.loads(response.content.decode('utf-8'))
+
+    def put(self, upload, content):
+        """PUT content to a presigned upload, returning the key."""
+        url = urlsplit(upload['url'])
+        headers = dict((str(name), str(value))
+                       for name, value in upload['headers'].items())
+        connection = HTTPConnection(url.netloc)
+        try:
+            connection.request(str('PUT'), str(url.path + '?' + url.query),
+                               content, headers)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        self.assertEqual(response.status, 200)
+        self.fake_s3.reset_counts()
+        return self.bucket.get_key(upload['key'])
+
+    def test_presign(self):
+        response, data = self.post_files([self.get_file(b'hello'),
+                                          self.get_file(b'world')])
+        self.assertEqual(response.status_code, 200)
+        uploads = data['uploads']
+        self.assertEqual(len(uploads), 2)
+        self.assertNotEqual(uploads[0]['key'], uploads[1]['key'])
+        self.assertEqual(uploads[0]['bucket'], self.bucket_name)
+        self.assertEqual(uploads[0]['method'], 'PUT')
+        self.assertTrue(uploads[0]['key'].endswith('/upload.txt'))
+        self.assertEqual(uploads[0]['headers']['Content-Type'], 'text/plain')
+        # Presigning makes no S3 requests
+        self.assertEqual(dict(self.fake_s3.counts), {})
+
+    def test_put_and_validate(self):
+        response, data = self.post_files([self.get_file(b'hello')])
+        key = self.put(data['uploads'][0], b'hello')
+        view = DropzoneS3UploadFormView.as_view(**self.view_kwargs)
+        response = self.post_ping(view, key)
+        self.assertEqual(response.status_code, 200)
+        key_names = self.get_key_names()
+        self.assertEqual(len(key_names), 1)
+        self.assertEqual(self.bucket.get_key(key_names[0]).
+                         get_contents_as_string(), b'hello')
+
+    def test_put_larger_than_presigned(self):
+        # S3 does not enforce the presigned size, so it is validated again
+        response, data = self.post_files([self.get_file(b'hello')])
+        key = self.put(data['uploads'][0], b'x' * 2048)
+        view = DropzoneS3UploadFormView.as_view(**self.view_kwargs)
+        self.assertEqual(self.post_ping(view, key).status_code, 400)
+
+    def test_not_enabled(self):
+        response, data = self.post_files([self.get_file(b'hello')],
+                                         presigned_put=False)
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_request(self):
+        for files in [[], 'upload.txt', ['upload.txt'],
+                      [self.get_file(b'hello')] * 101]:
+            response, data = self.post_files(files)
+            self.assertEqual(response.status_code, 400)
+
+    def test_invalid_files(self):
+        response, data = self.post_files([
+            self.get_file(b'hello'),
+            self.get_file(b'hello', content_type='image/png'),
+            self.get_file(b'hello', size=2048),
+        ], content_type_prefix='text/')
+        self.assertEqual(response.status_code, 400)
+        errors = data['errors']
+        self.assertEqual(errors[0], {})
+        self.assertEqual(errors[1],
+                         {'content_type': ['Content-Type does not validate.']})
+        self.assertEqual(errors[2],
+                         {'size': ['File size does not validate.']})
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from . import S3TestCase
+from django.core.exceptions import ImproperlyConfigured
+from s3upload.views import DropzoneS3UploadFormView, S3UploadFormView
+import time
+
+
+class RedirectTokenTestCase(S3TestCase):
+
+    view_kwargs = {'redirect_authentication': 'token',
+                   'success_url': '/done/'}
+
+    def get_token(self, expires=None, **view_kwargs):
+        view = S3UploadFormView(**dict(self.view_kwargs, **view_kwargs))
+        view.request = self.factory.get('/')
+        return view.get_redirect_token(expires)
+
+    def get_redirect(self, key, token, **view_kwargs):
+        """GET the view as S3 redirects to it after an upload."""
+        view = S3UploadFormView.as_view(**dict(self.view_kwargs,
+                                               **view_kwargs))
+        return view(self.factory.get('/', {
+            'bucket': self.bucket_name, 'key': key.name, 'etag': key.etag,
+            'token': token}))
+
+    def test_form(self):
+        view = S3UploadFormView.as_view(**self.view_kwargs)
+        response = view(self.factory.get('/'))
+        response.render()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'token=', response.content)
+        # The page does not depend upon the user, so can be cached
+        self.assertEqual(response.cookies, {})
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+    def test_csrf_form(self):
+        view = S3UploadFormView.as_view(redirect_authentication='csrf')
+        response = view(self.factory.get('/'))
+        response.render()
+        self.assertIn('csrftoken', response.cookies)
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_valid_token(self):
+        response = self.get_redirect(self.upload(b'hello'), self.get_token())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], '/done/')
+        key_names = self.get_key_names()
+        self.assertEqual(len(key_names), 1)
+        self.assertTrue(key_names[0].startswith('processed/'))
+
+    def assertRejected(self, token):
+        key = self.upload(b'hello')
+        response = self.get_redirect(key, token)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.get_key_names(), [key.name])
+
+    def test_tampered_token(self):
+        token = self.get_token()
+        expires, _, signature = token.partition(':')
+        self.assertRejected('{0}:{1}'.format(int(expires) + 3600, signature))
+        self.assertRejected('{0}:{1}'.format(
+            expires, signature[:-1] + ('0' if signature[-1] != '0' else '1')))
+
+    def test_empty_token(self):
+        self.assertRejected('')
+
+    def test_invalid_token(self):
+        self.assertRejected('not a token')
+
+    def test_expired_token(self):
+        self.assertRejected(self.get_token(int(time.time()) - 1))
+
+    def test_other_key_prefix_token(self):
+        self.assertRejected(self.get_token(upload_to='other/'))
+
+    def test_dropzone_token(self):
+        view = DropzoneS3UploadFormView.as_view(
+            redirect_authentication='token')
+        with self.assertRaises(ImproperlyConfigured):
+            view(self.factory.get('/'))
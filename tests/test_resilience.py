@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from . import S3TestCase
+from django.test import SimpleTestCase, override_settings
+from s3upload import resilience
+from s3upload.archives import expand_archive
+import io
+import itertools
+import random
+import zipfile
+
+
+def find_seed(faults, rate):
+    """Return a seed which injects the given sequence of faults (whether
+    each request is faulty), at the given rate."""
+    for seed in itertools.count():
+        generator = random.Random(seed)
+        if [generator.random() < rate for fault in faults] == faults:
+            return seed
+
+
+class ServerError(Exception):
+
+    status = 503
+
+
+class RetryTestCase(SimpleTestCase):
+
+    def call(self, error):
+        calls = []
+
+        def function():
+            calls.append(True)
+            raise error
+
+        with self.assertRaises(type(error)):
+            resilience.call(function)
+        return len(calls)
+
+    def test_not_retried_by_default(self):
+        # boto retries server errors itself
+        self.assertEqual(self.call(ServerError()), 1)
+
+    @override_settings(S3UPLOAD_RETRY_ATTEMPTS=3)
+    def test_retried(self):
+        self.assertEqual(self.call(ServerError()), 3)
+
+    @override_settings(S3UPLOAD_RETRY_ATTEMPTS=3)
+    def test_not_retryable(self):
+        self.assertEqual(self.call(ValueError()), 1)
+
+
+@override_settings(S3UPLOAD_RETRY_ATTEMPTS=2)
+class RetriedReadsTestCase(S3TestCase):
+
+    def setUp(self):
+        super(RetriedReadsTestCase, self).setUp()
+        self.fake_s3.fault_operations = ['get_object']
+
+    def tearDown(self):
+        self.fake_s3.error_rate = 0
+        self.fake_s3.fault_operations = None
+        super(RetriedReadsTestCase, self).tearDown()
+
+    def test_derivative_read(self):
+        form = self.get_validate_form(
+            self.upload(b'hello'),
+            derivatives={'reversed': 'tests.renderers.reverse'})
+        self.assertTrue(form.is_valid())
+        processed_key = form.process_upload()
+        self.fake_s3.reset_counts()
+        self.fake_s3.error_rate = 1
+        self.assertEqual(form.process_derivatives(processed_key).get(5),
+                         {})
+        self.assertEqual(self.fake_s3.counts['get_object'], 2)
+
+    def test_archive_read(self):
+        content = io.BytesIO()
+        with zipfile.ZipFile(content, 'w') as archive:
+            archive.writestr('member.txt', b'hello')
+        key = self.upload(content.getvalue(), 'incoming/upload.zip',
+                          'application/zip')
+        key = self.bucket.get_key(key.name)
+        self.fake_s3.error_rate = 1
+        with self.assertRaises(Exception):
+            expand_archive(key, 'application/zip', 'text/',
+                           lambda name: 'processed/' + name, 'private')
+        self.assertEqual(self.fake_s3.counts['get_object'], 2)
+
+
+@override_settings(S3UPLOAD_HEDGE_DELAY=0.05)
+class HedgedReadsTestCase(S3TestCase):
+
+    def setUp(self):
+        super(HedgedReadsTestCase, self).setUp()
+        resilience.counters.reset()
+        self.fake_s3.slow_delay = 0.5
+
+    def tearDown(self):
+        self.fake_s3.slow_rate = 0
+        self.fake_s3.slow_delay = 1
+        self.fake_s3.fault_operations = None
+        super(HedgedReadsTestCase, self).tearDown()
+
+    def inject(self, operation, faults):
+        """Slow the requests for an operation, by the sequence of
+        faults."""
+        self.fake_s3.fault_operations = [operation]
+        self.fake_s3.slow_rate = 0.5
+        self.fake_s3.seed(find_seed(faults, 0.5))
+
+    def validate(self):
+        form = self.get_validate_form(self.upload(b'hello'))
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_upload_key().size, 5)
+        self.assertEqual(form.get_upload_content_type(), 'text/plain')
+        return resilience.counters.snapshot()
+
+    def test_not_hedged(self):
+        counters = self.validate()
+        self.assertNotIn('hedges', counters)
+        self.assertEqual(dict(self.fake_s3.counts),
+                         {'head_object': 1, 'get_object': 1})
+
+    def test_hedge_wins_head(self):
+        self.inject('head_object', [True, False])
+        counters = self.validate()
+        self.assertEqual(counters['hedges'], 1)
+        self.assertEqual(counters['hedge_wins'], 1)
+        self.assertEqual(self.fake_s3.counts['head_object'], 2)
+
+    def test_hedge_wins_get(self):
+        self.inject('get_object', [True, False])
+        counters = self.validate()
+        self.assertEqual(counters['hedges'], 1)
+        self.assertEqual(counters['hedge_wins'], 1)
+        self.assertEqual(self.fake_s3.counts['get_object'], 2)
+
+    def test_hedge_loses(self):
+        # Both requests are slow, so the first responds first
+        self.inject('get_object', [True, True])
+        counters = self.validate()
+        self.assertEqual(counters['hedges'], 1)
+        self.assertNotIn('hedge_wins', counters)
+        self.assertEqual(self.fake_s3.counts['get_object'], 2)
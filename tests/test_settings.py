@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from django.test import SimpleTestCase, override_settings
+from s3upload import settings
+
+
+class SettingsTestCase(SimpleTestCase):
+
+    def test_module_attributes(self):
+        from s3upload.settings import EXPIRATION_TIMEDELTA, SET_CONTENT_TYPE
+        self.assertEqual(SET_CONTENT_TYPE, True)
+        self.assertEqual(EXPIRATION_TIMEDELTA,
+                         settings.DEFAULTS['EXPIRATION_TIMEDELTA'])
+
+    def test_module_attributes_are_read_on_access(self):
+        with override_settings(S3UPLOAD_SET_CONTENT_TYPE=False,
+                               CSRF_FAILURE_VIEW='myapp.views.csrf_failure'):
+            self.assertEqual(settings.SET_CONTENT_TYPE, False)
+            self.assertEqual(settings.settings.SET_CONTENT_TYPE, False)
+            self.assertEqual(settings.CSRF_FAILURE_VIEW,
+                             'myapp.views.csrf_failure')
+
+    def test_unknown_setting(self):
+        with self.assertRaises(AttributeError):
+            settings.UNKNOWN
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Matt Austin
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, unicode_literals
+from django.test import SimpleTestCase
+from s3upload.signing import URLSigner, get_signer
+from storages.backends.s3boto import S3BotoStorage
+import gc
+import weakref
+
+try:
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:
+    from urlparse import parse_qs, urlsplit
+
+
+class SignerTestCase(SimpleTestCase):
+
+    def test_signer_is_shared_per_storage(self):
+        storage = S3BotoStorage()
+        self.assertIs(get_signer(storage), get_signer(storage))
+        self.assertIsNot(get_signer(storage), get_signer(S3BotoStorage()))
+
+    def test_signer_is_released_with_storage(self):
+        storage = S3BotoStorage()
+        signer = weakref.ref(get_signer(storage))
+        storage = weakref.ref(storage)
+        gc.collect()
+        self.assertIsNone(storage())
+        self.assertIsNone(signer())
+
+    def test_sign(self):
+        storage = S3BotoStorage(querystring_auth=True)
+        signer = URLSigner(storage)
+        urls = signer.sign(['a.txt', 'b/c d.txt'])
+        expires = int(parse_qs(urlsplit(urls[0]).query)['Expires'][0])
+        self.assertEqual(urls, [
+            storage.connection.generate_url(
+                expires, 'GET', bucket=storage.bucket_name, key=name,
+                expires_in_absolute=True, force_http=not storage.secure_urls)
+            for name in ['a.txt', 'b/c d.txt']])
+        # Cached
+        self.assertEqual(signer.sign(['b/c d.txt', 'a.txt']), urls[::-1])
+
+    def test_cache_size(self):
+        signer = URLSigner(S3BotoStorage(querystring_auth=True), cache_size=2)
+        signer.sign(['a.txt', 'b.txt'])
+        signer.sign(['c.txt'])
+        self.assertEqual(list(signer._cache), ['c.txt'])